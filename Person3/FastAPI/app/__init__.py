@@ -0,0 +1,8 @@
+# Load .env before any app.* module reads its settings: they are module-level constants read at import.
+# The working directory is searched first (uvicorn is started from Person3/FastAPI), then upward from this package.
+try:
+    from dotenv import find_dotenv, load_dotenv
+    load_dotenv(find_dotenv(usecwd=True))
+    load_dotenv()
+except ImportError:
+    pass
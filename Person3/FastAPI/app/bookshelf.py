@@ -0,0 +1,203 @@
+"""
+FocusFlow 3D - Person 3: bookshelf fan-out shared by search.py and search_exa.py.
+Fetches topics concurrently (bounded per backend) and stops waiting at a deadline.
+Topics shed by the rate limiter (app/ratelimit.py) are listed in rate_limited_topics instead of
+showing up as error "books".
+gather_bookshelf / aiter_bookshelf are the asyncio versions: they wait on the event loop, not a thread.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.metrics import ContextThreadPoolExecutor
+from app.ratelimit import RateLimited
+
+BOOKSHELF_DEADLINE = float(os.environ.get("BOOKSHELF_DEADLINE_S", "8"))
+# Max concurrent upstream calls per backend, e.g. BOOKSHELF_CONCURRENCY_EXA=8
+DEFAULT_CONCURRENCY = {"duckduckgo": 4, "exa": 8, "local": 4}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def backend_concurrency(backend: str) -> int:
+    env = os.environ.get(f"BOOKSHELF_CONCURRENCY_{backend.upper()}")
+    return max(1, int(env)) if env else DEFAULT_CONCURRENCY.get(backend, 4)
+
+
+def get_executor(backend: str) -> ThreadPoolExecutor:
+    """One bounded pool per backend, shared by all requests, so the limit holds process-wide."""
+    with _executors_lock:
+        if backend not in _executors:
+            _executors[backend] = ContextThreadPoolExecutor(
+                max_workers=backend_concurrency(backend), thread_name_prefix=f"bookshelf-{backend}"
+            )
+        return _executors[backend]
+
+
+def clean_topics(topics: List[str]) -> List[str]:
+    """Strip blanks and duplicates, keep order."""
+    seen, out = set(), []
+    for t in topics:
+        if not t or not t.strip():
+            continue
+        t = t.strip()
+        if t not in seen:
+            seen.add(t)
+            out.append(t)
+    return out
+
+
+def tag_items(items: List[dict], **fields) -> List[dict]:
+    """New dicts with fields added (topic=..., backend=...). Cached result lists are shared, so never tag in place."""
+    return [{**item, **fields} for item in items]
+
+
+def _error_items(e: Exception) -> List[dict]:
+    return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "article"}]
+
+
+def _shelf(futures: dict) -> dict:
+    """{topic: future or task} -> {resources, partial, pending_topics, rate_limited_topics}."""
+    resources, pending, shed = [], [], []
+    for t, fut in futures.items():
+        if not fut.done():
+            pending.append(t)
+            continue
+        try:
+            items = fut.result()
+        except RateLimited:
+            shed.append(t)
+            continue
+        except Exception as e:
+            items = _error_items(e)
+        resources.extend(tag_items(items, topic=t))
+    return {"resources": resources, "partial": bool(pending or shed), "pending_topics": pending, "rate_limited_topics": shed}
+
+
+def fetch_bookshelf(
+    search_fn: Callable[..., List[dict]],
+    backend: str,
+    topics: List[str],
+    per_topic: int = 3,
+    skip_cache: bool = False,
+    deadline: Optional[float] = None,
+) -> dict:
+    """
+    Run search_fn for every topic in parallel and tag items with their topic.
+    Returns {resources, partial, pending_topics, rate_limited_topics}. Topics still running at the deadline are
+    left to finish in the background (they land in the cache), so a retry picks them up.
+    """
+    topic_list = clean_topics(topics)
+    timeout = BOOKSHELF_DEADLINE if deadline is None else deadline
+    pool = get_executor(backend)
+    futures = {t: pool.submit(search_fn, t, max_results=per_topic, skip_cache=skip_cache) for t in topic_list}
+    if futures:
+        wait(futures.values(), timeout=timeout if timeout > 0 else None)
+    return _shelf(futures)
+
+
+# Tasks left running past a deadline: referenced until done so they are not garbage collected mid-flight.
+_background: set = set()
+
+
+def detach(task: "asyncio.Future") -> None:
+    """Let a task finish in the background; its result (or exception) is dropped."""
+    _background.add(task)
+    task.add_done_callback(lambda t: (_background.discard(t), t.cancelled() or t.exception()))
+
+
+async def gather_bookshelf(
+    search_fn: Callable[..., Awaitable[List[dict]]],
+    topics: List[str],
+    per_topic: int = 3,
+    skip_cache: bool = False,
+    deadline: Optional[float] = None,
+) -> dict:
+    """Async fetch_bookshelf: search_fn is a coroutine function; same result shape."""
+    topic_list = clean_topics(topics)
+    timeout = BOOKSHELF_DEADLINE if deadline is None else deadline
+    tasks = {t: asyncio.ensure_future(search_fn(t, max_results=per_topic, skip_cache=skip_cache)) for t in topic_list}
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=timeout if timeout > 0 else None)
+    for task in tasks.values():
+        if not task.done():
+            detach(task)
+    return _shelf(tasks)
+
+
+def _topic_event(t: str, items: List[dict], cached: bool, start: float) -> dict:
+    return {
+        "type": "topic",
+        "topic": t,
+        "cached": cached,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "resources": tag_items(items, topic=t),
+    }
+
+
+def _done_event(topic_list: List[str], remaining: List[str], pending: set, shed: List[str], cache_hits: int, start: float) -> dict:
+    return {
+        "type": "done",
+        "topics": len(topic_list),
+        "cache_hits": cache_hits,
+        "partial": bool(pending or shed),
+        "pending_topics": [t for t in remaining if t in pending],
+        "rate_limited_topics": shed,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+async def aiter_bookshelf(
+    search_fn: Callable[..., Awaitable[List[dict]]],
+    peek_fn: Callable[..., Optional[List[dict]]],
+    topics: List[str],
+    per_topic: int = 3,
+    skip_cache: bool = False,
+    deadline: Optional[float] = None,
+) -> AsyncIterator[dict]:
+    """
+    Streaming gather_bookshelf: yields {"type": "topic", ...} as each topic resolves (cached topics first),
+    then one {"type": "done", ...} record with timing, cache hits and any topics that missed the deadline
+    or were shed by the rate limiter (those get no topic event). peek_fn is a fast in-memory lookup.
+    """
+    start = time.perf_counter()
+    timeout = BOOKSHELF_DEADLINE if deadline is None else deadline
+    topic_list = clean_topics(topics)
+
+    remaining, cache_hits = [], 0
+    for t in topic_list:
+        cached = None if skip_cache else peek_fn(t, max_results=per_topic)
+        if cached is not None:
+            cache_hits += 1
+            yield _topic_event(t, cached, True, start)
+        else:
+            remaining.append(t)
+
+    tasks = {asyncio.ensure_future(search_fn(t, max_results=per_topic, skip_cache=skip_cache)): t for t in remaining}
+    pending, shed = set(remaining), []
+    ends_at = time.monotonic() + timeout if timeout > 0 else None
+    try:
+        while tasks:
+            left = None if ends_at is None else ends_at - time.monotonic()
+            if left is not None and left <= 0:
+                break
+            done, _ = await asyncio.wait(tasks, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                t = tasks.pop(task)
+                pending.discard(t)
+                try:
+                    items = task.result()
+                except RateLimited:
+                    shed.append(t)
+                    continue
+                except Exception as e:
+                    items = _error_items(e)
+                yield _topic_event(t, items, False, start)
+    finally:
+        for task in tasks:  # past the deadline (or client gone): finish in the background, land in the cache
+            detach(task)
+    yield _done_event(topic_list, remaining, pending, shed, cache_hits, start)
@@ -0,0 +1,468 @@
+"""
+FocusFlow 3D - Person 3: shared search result cache.
+LRU + per-entry TTL + rough memory cap, used by both search.py and search_exa.py.
+Optional persistent tier (app/cache_store.py) with stale-while-revalidate.
+cached_fetch_async is the event-loop version: callers coalesce on an asyncio task, not a pool thread.
+Inside track_freshness(), every cached answer records how long it stays fresh (for Cache-Control).
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.ratelimit import RateLimited, TokenBucket
+
+CACHE_MAX = int(os.environ.get("SEARCH_CACHE_MAX", "200"))
+CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "3600"))  # seconds
+CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+# Expired entries younger than ttl + stale_ttl are still served while a background refresh runs
+CACHE_STALE_TTL = float(os.environ.get("SEARCH_CACHE_STALE_TTL", "86400"))
+CACHE_WARM_LIMIT = int(os.environ.get("SEARCH_CACHE_WARM_LIMIT", "200"))
+
+# Per-request list of remaining freshness (seconds) of each cached answer used, set by track_freshness().
+_freshness: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("search_freshness", default=None)
+
+
+def _record_ttl(seconds: float) -> None:
+    ttls = _freshness.get()
+    if ttls is not None:
+        ttls.append(max(0.0, seconds))
+
+
+def record_uncached() -> None:
+    """The current answer did not come from the search cache (e.g. the local index): track_freshness gets None."""
+    ttls = _freshness.get()
+    if ttls is not None:
+        ttls.append(None)
+
+
+@contextmanager
+def track_freshness():
+    """with track_freshness() as ttls: ... -> ttls lists the seconds each answer used stays fresh (0 = served stale,
+    None = not from the cache).
+    Tasks started inside share the list, so a bookshelf collects one entry per topic."""
+    token = _freshness.set([])
+    try:
+        yield _freshness.get()
+    finally:
+        _freshness.reset(token)
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate size of a cached value (JSON bytes). Good enough for a cap."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache. Entries expire after ttl seconds; oldest are evicted past max_entries / max_bytes.
+    With persistent=True, writes go through to the store from app/cache_store.py and memory misses read from it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = CACHE_MAX,
+        ttl: float = CACHE_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        stale_ttl: float = CACHE_STALE_TTL,
+        persistent: bool = True,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.persistent = persistent
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.store_hits = 0
+        self.store_errors = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _store(self):
+        if not self.persistent:
+            return None
+        from app.cache_store import get_store
+        return get_store()
+
+    def _store_key(self, key: Hashable) -> str:
+        return f"{self.name}:{json.dumps(key)}"
+
+    def store_configured(self) -> bool:
+        from app.cache_store import SEARCH_CACHE_PERSIST
+        return self.persistent and bool(SEARCH_CACHE_PERSIST)
+
+    def lookup(self, key: Hashable, use_store: bool = True) -> Optional[Tuple[Any, float]]:
+        """Return (value, seconds it stays fresh) from memory, then the persistent store; None on a miss.
+        Stale entries (still within stale_ttl) come back with 0.0.
+        use_store=False never does I/O (event loop): with a store configured, a memory miss returns None uncounted."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                now = time.monotonic()
+                if now < expires_at:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value, expires_at - now
+                if now < expires_at + self.stale_ttl:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    return value, 0.0
+                self._remove(key)
+                self.expirations += 1
+        if not use_store and self.store_configured():
+            return None
+        found = self._lookup_store(key)
+        with self._lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.store_hits += 1
+                if found[1] > 0:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+        return found
+
+    def _lookup_store(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        store = self._store()
+        if store is None:
+            return None
+        try:
+            row = store.get(self._store_key(key))
+        except Exception:
+            self.store_errors += 1
+            return None
+        if row is None:
+            return None
+        value, stored_at = row
+        age = time.time() - stored_at
+        if age >= self.ttl + self.stale_ttl:
+            return None
+        self.set(key, value, ttl=self.ttl - age, persist=False)
+        return value, max(0.0, self.ttl - age)
+
+    def peek(self, key: Hashable, record: bool = False) -> Optional[Any]:
+        """Fresh value from memory only. Never touches the store; record=True counts a hit, refreshes LRU order
+        and records the entry's remaining freshness (track_freshness)."""
+        with self._lock:
+            entry = self._data.get(key)
+            now = time.monotonic()
+            if entry is None or now >= entry[1]:
+                return None
+            if record:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if record:
+            _record_ttl(entry[1] - now)
+        return entry[0]
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a fresh cached value or None (missing or expired)."""
+        found = self.lookup(key)
+        return found[0] if found and found[1] > 0 else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, persist: bool = True) -> None:
+        """Store value; evicts least recently used entries if over either cap. Writes through to the store."""
+        size = _sizeof(value)
+        if size <= self.max_bytes:
+            expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+            with self._lock:
+                if key in self._data:
+                    self._remove(key)
+                self._data[key] = (value, expires_at, size)
+                self._bytes += size
+                while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                    oldest = next(iter(self._data))
+                    self._remove(oldest)
+                    self.evictions += 1
+        store = self._store() if persist else None
+        if store is not None:
+            try:
+                store.set(self._store_key(key), value)
+            except Exception:
+                self.store_errors += 1
+
+    def warm(self, limit: int = CACHE_WARM_LIMIT) -> int:
+        """Load the most recent usable entries from the store into memory. Returns how many were loaded."""
+        store = self._store()
+        if store is None:
+            return 0
+        now = time.time()
+        try:
+            store.prune(older_than=now - self.ttl - self.stale_ttl)
+            rows = store.load_recent(f"{self.name}:", newer_than=now - self.ttl - self.stale_ttl, limit=min(limit, self.max_entries))
+        except Exception as e:
+            print(f"Cache warm-up for {self.name} failed:", e)
+            return 0
+        for skey, value, stored_at in reversed(rows):  # oldest first so the newest end up most recently used
+            key = tuple(json.loads(skey[len(self.name) + 1:]))
+            self.set(key, value, ttl=self.ttl - (now - stored_at), persist=False)
+        return len(rows)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        # Caller holds the lock.
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        store = self._store()
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "stale_ttl_seconds": self.stale_ttl,
+                "persistent": store.kind if store is not None else None,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "store_hits": self.store_hits,
+                "store_errors": self.store_errors,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def combined_stats(*caches: TTLCache) -> dict:
+    """Stats for /vibe: totals across caches plus a per-cache breakdown."""
+    per_cache = {c.name: c.stats() for c in caches}
+    hits = sum(s["hits"] + s["stale_hits"] for s in per_cache.values())
+    misses = sum(s["misses"] for s in per_cache.values())
+    return {
+        "cached_queries": sum(s["entries"] for s in per_cache.values()),
+        "max": sum(s["max"] for s in per_cache.values()),
+        "persistent": next((s["persistent"] for s in per_cache.values() if s["persistent"]), None),
+        "hits": hits,
+        "stale_hits": sum(s["stale_hits"] for s in per_cache.values()),
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        "evictions": sum(s["evictions"] for s in per_cache.values()),
+        "expirations": sum(s["expirations"] for s in per_cache.values()),
+        "caches": per_cache,
+    }
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: one caller runs fn, the rest wait and share its result.
+    do() is for threads; do_async() for coroutines, whose waiters share one asyncio task and hold no thread.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, "asyncio.Task"] = {}  # touched only from the event loop
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """First caller starts fn() as a task; everyone awaits it. A cancelled caller does not cancel the task."""
+        task = self._tasks.get(key)
+        with self._lock:
+            if task is None:
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+
+            def done(t: "asyncio.Task") -> None:
+                if self._tasks.get(key) is t:
+                    del self._tasks[key]
+                if not t.cancelled():
+                    t.exception()  # retrieved even if every caller went away
+
+            task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"upstream_calls": self.leaders, "coalesced_callers": self.coalesced,
+                    "in_flight": len(self._calls) + len(self._tasks)}
+
+
+# Background stale-while-revalidate refreshes (small: these are upstream calls)
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_in_background(flight: "SingleFlight", flight_key: Hashable, load: Callable[[], Any]) -> None:
+    with _refreshing_lock:
+        if flight_key in _refreshing:
+            return
+        _refreshing.add(flight_key)
+
+    def run():
+        try:
+            flight.do(flight_key, load)
+        except Exception:
+            pass  # keep serving the stale value; the next lookup retries
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(flight_key)
+
+    _refresh_pool.submit(run)
+
+
+def cached_fetch(cache: TTLCache, flight: SingleFlight, key: Hashable, fetch: Callable[[], Any], skip_cache: bool = False) -> Any:
+    """
+    Cache lookup, then one coalesced upstream fetch per key whose result is stored. Errors propagate and are not cached.
+    Stale entries are returned immediately and refreshed in the background. A rate-limited refresh
+    (skip_cache) falls back to the cached value, if there is one.
+    """
+
+    def load():
+        value = fetch()
+        cache.set(key, value)
+        return value
+
+    flight_key = (cache.name, key)
+    if not skip_cache:
+        found = cache.lookup(key)
+        if found is not None:
+            value, ttl_left = found
+            if ttl_left <= 0:
+                _refresh_in_background(flight, flight_key, load)
+            _record_ttl(ttl_left)
+            return value
+    try:
+        value = flight.do(flight_key, load)
+    except RateLimited:
+        found = cache.lookup(key) if skip_cache else None
+        if found is None:
+            raise
+        _record_ttl(found[1])
+        return found[0]
+    _record_ttl(cache.ttl)
+    return value
+
+
+async def cached_fetch_async(
+    cache: TTLCache,
+    flight: SingleFlight,
+    key: Hashable,
+    upstream: Callable[[], Any],
+    executor: ThreadPoolExecutor,
+    limiter: Optional[TokenBucket] = None,
+    guard: Optional[Callable] = None,
+    admit: Optional[Callable[[], None]] = None,
+    skip_cache: bool = False,
+) -> Any:
+    """
+    cached_fetch for async callers. Memory lookup and coalescing happen on the event loop, so identical misses
+    share one task; that task waits for its rate-limit token with asyncio.sleep and then submits a single job
+    (guard(upstream), then cache.set) to executor, so pool threads only ever run upstream calls.
+    admit() runs on the loop before a token is taken and may raise to skip the call (the router's open breaker).
+    The answer's remaining freshness is recorded in the caller's context, also for callers that joined a flight.
+    """
+    loop = asyncio.get_running_loop()
+
+    def store(value):
+        cache.set(key, value)
+        return value
+
+    def fetch_now():
+        return store(guard(upstream) if guard else upstream()), cache.ttl
+
+    def refresh():  # stale-while-revalidate on the refresh pool, which may sleep for its token
+        fetch = (lambda: limiter.run(upstream)) if limiter is not None else upstream
+        return store(guard(fetch) if guard else fetch())
+
+    def serve(found):
+        if found[1] <= 0:
+            _refresh_in_background(flight, flight_key, refresh)
+        return found
+
+    async def load():
+        if not skip_cache and cache.store_configured():
+            found = await loop.run_in_executor(executor, cache.lookup, key)
+            if found is not None:
+                return serve(found)
+        if admit is not None:
+            admit()
+        if limiter is not None:
+            wait_s = limiter.reserve()
+            if wait_s > 0:
+                await asyncio.sleep(wait_s)
+        return await loop.run_in_executor(executor, fetch_now)
+
+    flight_key = (cache.name, key)
+    found = cache.lookup(key, use_store=False) if not skip_cache else None
+    try:
+        value, ttl_left = serve(found) if found is not None else await flight.do_async(flight_key, load)
+    except RateLimited:
+        found = await loop.run_in_executor(executor, cache.lookup, key) if skip_cache else None
+        if found is None:
+            raise
+        value, ttl_left = found
+    _record_ttl(ttl_left)
+    return value
@@ -0,0 +1,138 @@
+"""
+FocusFlow 3D - Person 3: optional persistent tier for the search cache.
+Shared by every worker and survives restarts. Pick one with SEARCH_CACHE_PERSIST:
+  sqlite   -> local file (SEARCH_CACHE_SQLITE_PATH), WAL mode so workers can share it
+  postgres -> search_cache table in the database from app/database.py
+Unset (default) keeps the cache in memory only.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+SEARCH_CACHE_PERSIST = os.environ.get("SEARCH_CACHE_PERSIST", "").strip().lower()
+SEARCH_CACHE_SQLITE_PATH = os.environ.get("SEARCH_CACHE_SQLITE_PATH", "search_cache.sqlite3")
+
+
+class SQLiteCacheStore:
+    """key -> (JSON value, stored_at unix time) in a local SQLite file."""
+
+    kind = "sqlite"
+
+    def __init__(self, path: str = SEARCH_CACHE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite connections must not be shared across threads.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        row = self._conn().execute("SELECT value, stored_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored_at or time.time()),
+            )
+
+    def load_recent(self, prefix: str, newer_than: float, limit: int) -> List[Tuple[str, Any, float]]:
+        rows = self._conn().execute(
+            "SELECT key, value, stored_at FROM search_cache WHERE key LIKE ? AND stored_at > ? ORDER BY stored_at DESC LIMIT ?",
+            (prefix + "%", newer_than, limit),
+        ).fetchall()
+        return [(k, json.loads(v), t) for k, v, t in rows]
+
+    def prune(self, older_than: float) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM search_cache WHERE stored_at < ?", (older_than,))
+
+
+class PostgresCacheStore:
+    """Same interface, stored in the app's Postgres database (search_cache table)."""
+
+    kind = "postgres"
+
+    def __init__(self):
+        from sqlalchemy import text
+        from app.database import engine
+
+        self._text = text
+        self._engine = engine
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS search_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at DOUBLE PRECISION NOT NULL)"
+            ))
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._engine.connect() as conn:
+            row = conn.execute(self._text("SELECT value, stored_at FROM search_cache WHERE key = :k"), {"k": key}).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(
+                self._text(
+                    "INSERT INTO search_cache (key, value, stored_at) VALUES (:k, :v, :t) "
+                    "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, stored_at = EXCLUDED.stored_at"
+                ),
+                {"k": key, "v": json.dumps(value), "t": stored_at or time.time()},
+            )
+
+    def load_recent(self, prefix: str, newer_than: float, limit: int) -> List[Tuple[str, Any, float]]:
+        with self._engine.connect() as conn:
+            rows = conn.execute(
+                self._text(
+                    "SELECT key, value, stored_at FROM search_cache WHERE key LIKE :p AND stored_at > :t "
+                    "ORDER BY stored_at DESC LIMIT :n"
+                ),
+                {"p": prefix + "%", "t": newer_than, "n": limit},
+            ).fetchall()
+        return [(k, json.loads(v), t) for k, v, t in rows]
+
+    def prune(self, older_than: float) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(self._text("DELETE FROM search_cache WHERE stored_at < :t"), {"t": older_than})
+
+
+_store = None
+_store_lock = threading.Lock()
+_retry = {"at": 0.0, "interval": 5.0}
+STORE_RETRY_MAX_S = 300
+
+
+def get_store():
+    """
+    Configured persistent store, or None (memory-only for now). A store that cannot be opened is retried with
+    backoff (5s doubling to 5 min); the postgres one is not tried until the database is up (see app/database.py).
+    """
+    global _store
+    if not SEARCH_CACHE_PERSIST or _store is not None:
+        return _store
+    if SEARCH_CACHE_PERSIST == "postgres":
+        from app.database import db_status
+        if not db_status["ready"]:
+            return None
+    with _store_lock:
+        if _store is None and time.monotonic() >= _retry["at"]:
+            try:
+                _store = PostgresCacheStore() if SEARCH_CACHE_PERSIST == "postgres" else SQLiteCacheStore()
+            except Exception as e:
+                print(f"Persistent search cache unavailable, using memory only (retry in {_retry['interval']:.0f}s):", e)
+                _retry["at"] = time.monotonic() + _retry["interval"]
+                _retry["interval"] = min(_retry["interval"] * 2, STORE_RETRY_MAX_S)
+        return _store
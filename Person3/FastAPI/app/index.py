@@ -0,0 +1,190 @@
+"""
+FocusFlow 3D - Person 3: local full-text index of every resource the search backends return.
+SQLite FTS5 ranked by BM25. With local_first, /search and /bookshelf answer from here when there
+are enough matches and only go to DuckDuckGo/Exa when there are not.
+Set RESOURCE_INDEX=0 to turn it off. Entries older than RESOURCE_INDEX_MAX_AGE_S are never served and are
+pruned on the writer thread, along with the oldest rows past RESOURCE_INDEX_MAX_ROWS.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+RESOURCE_INDEX_ENABLED = os.environ.get("RESOURCE_INDEX", "1").lower() not in ("0", "false", "no")
+RESOURCE_INDEX_PATH = os.environ.get("RESOURCE_INDEX_PATH", "resource_index.sqlite3")
+RESOURCE_INDEX_MAX_AGE_S = float(os.environ.get("RESOURCE_INDEX_MAX_AGE_S", str(30 * 86400)))
+RESOURCE_INDEX_MAX_ROWS = int(os.environ.get("RESOURCE_INDEX_MAX_ROWS", "50000"))
+PRUNE_EVERY_S = 600  # writes run a prune at most this often
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    id INTEGER PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    snippet TEXT NOT NULL,
+    type TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    backend TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_indexed_at ON resources(indexed_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS resources_fts USING fts5(
+    title, snippet, topic, content='resources', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS resources_ai AFTER INSERT ON resources BEGIN
+    INSERT INTO resources_fts(rowid, title, snippet, topic) VALUES (new.id, new.title, new.snippet, new.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS resources_ad AFTER DELETE ON resources BEGIN
+    INSERT INTO resources_fts(resources_fts, rowid, title, snippet, topic) VALUES ('delete', old.id, old.title, old.snippet, old.topic);
+END;
+CREATE TRIGGER IF NOT EXISTS resources_au AFTER UPDATE ON resources BEGIN
+    INSERT INTO resources_fts(resources_fts, rowid, title, snippet, topic) VALUES ('delete', old.id, old.title, old.snippet, old.topic);
+    INSERT INTO resources_fts(rowid, title, snippet, topic) VALUES (new.id, new.title, new.snippet, new.topic);
+END;
+"""
+
+# bm25 column weights: title matters most, then the topic it was found under, then the snippet
+_BM25 = "bm25(resources_fts, 5.0, 1.0, 2.0)"
+
+
+class ResourceIndex:
+    def __init__(self, path: str = RESOURCE_INDEX_PATH, max_age: float = RESOURCE_INDEX_MAX_AGE_S,
+                 max_rows: int = RESOURCE_INDEX_MAX_ROWS):
+        self.path = path
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self._local = threading.local()
+        # Single writer thread: SQLite allows one writer at a time and indexing stays off the request path.
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resource-index")
+        self.local_hits = 0
+        self.local_misses = 0
+        self.indexed = 0
+        self.errors = 0
+        self.pruned = 0
+        self._last_prune = 0.0
+        self._conn().executescript(_SCHEMA)
+        self._writer.submit(self.prune)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, items: List[dict], topic: str, backend: Optional[str] = None) -> None:
+        """Queue upstream results for indexing (returns immediately). Error items and blank URLs are skipped."""
+        rows = [
+            (item["url"], item.get("title", ""), item.get("snippet", ""), item.get("type", "article"), topic, backend, time.time())
+            for item in items
+            if item.get("url") and item.get("title") != "Error"
+        ]
+        if rows:
+            self._writer.submit(self._write, rows)
+
+    def _write(self, rows: list) -> None:
+        try:
+            with self._conn() as conn:
+                conn.executemany(
+                    "INSERT INTO resources (url, title, snippet, type, topic, backend, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(url) DO UPDATE SET title = excluded.title, snippet = excluded.snippet, type = excluded.type, "
+                    "topic = excluded.topic, backend = excluded.backend, indexed_at = excluded.indexed_at",
+                    rows,
+                )
+            self.indexed += len(rows)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print("Resource index write failed:", e)
+        if time.monotonic() - self._last_prune >= PRUNE_EVERY_S:
+            self.prune()
+
+    def prune(self) -> None:
+        """Drop rows past max_age, then the oldest past max_rows. Runs on the writer thread."""
+        self._last_prune = time.monotonic()
+        try:
+            with self._conn() as conn:
+                removed = conn.execute("DELETE FROM resources WHERE indexed_at < ?", (time.time() - self.max_age,)).rowcount
+                removed += conn.execute(
+                    "DELETE FROM resources WHERE id IN (SELECT id FROM resources ORDER BY indexed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                ).rowcount
+            self.pruned += removed
+        except sqlite3.Error as e:
+            self.errors += 1
+            print("Resource index prune failed:", e)
+
+    @staticmethod
+    def _match_query(text: str) -> Optional[str]:
+        # Quote every word so user input can't inject FTS5 syntax; all words must match.
+        words = re.findall(r"\w+", text.lower())
+        return " ".join(f'"{w}"' for w in words) or None
+
+    def search(self, query: str, limit: int = 5, content_type: Optional[str] = None) -> List[dict]:
+        """Best BM25 matches no older than max_age, shaped like backend results (backend="local")."""
+        match = self._match_query(query)
+        if not match:
+            return []
+        sql = (
+            f"SELECT r.title, r.url, r.snippet, r.type, {_BM25} AS rank FROM resources_fts "
+            "JOIN resources r ON r.id = resources_fts.rowid WHERE resources_fts MATCH ? AND r.indexed_at >= ?"
+        )
+        params: list = [match, time.time() - self.max_age]
+        if content_type:
+            sql += " AND r.type = ?"
+            params.append(content_type)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        try:
+            rows = self._conn().execute(sql, params).fetchall()
+        except sqlite3.Error:
+            self.errors += 1
+            return []
+        return [
+            {"title": r["title"], "url": r["url"], "snippet": r["snippet"], "score": round(1.0 - i * 0.1, 2),
+             "type": r["type"], "backend": "local", "bm25": round(-r["rank"], 3)}
+            for i, r in enumerate(rows)
+        ]
+
+    def lookup(self, query: str, limit: int, min_hits: Optional[int] = None) -> Optional[List[dict]]:
+        """local_first helper: the local hits if there are at least min_hits (default: limit), else None."""
+        hits = self.search(query, limit)
+        if len(hits) >= (limit if min_hits is None else min_hits):
+            self.local_hits += 1
+            return hits
+        self.local_misses += 1
+        return None
+
+    def stats(self) -> dict:
+        try:
+            docs = self._conn().execute("SELECT count(*) FROM resources").fetchone()[0]
+        except sqlite3.Error:
+            docs = None
+        return {"path": self.path, "documents": docs, "max_rows": self.max_rows, "max_age_seconds": self.max_age,
+                "indexed": self.indexed, "pruned": self.pruned, "local_first_hits": self.local_hits,
+                "local_first_misses": self.local_misses, "errors": self.errors}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_resource_index() -> Optional[ResourceIndex]:
+    """The process-wide index, opened on first use (importing this module creates no file); None if turned off."""
+    global _index
+    if not RESOURCE_INDEX_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = ResourceIndex()
+                except sqlite3.Error as e:
+                    print("Resource index unavailable:", e)
+                    _index = False  # a bad path won't fix itself; don't retry on every search
+    return _index or None
@@ -0,0 +1,210 @@
+"""
+FocusFlow 3D - Person 3: background bookshelf refresh / cache-warming jobs.
+In-process: one worker thread runs queued jobs topic by topic, paced to JOBS_UPSTREAM_PER_MIN upstream
+calls so warming never eats the rate limits the live requests need. Jobs can repeat every N seconds
+(e.g. keep an upcoming lesson's topics warm). HTTP callers get a job id back straight away.
+Searches run on the app's event loop (bind_loop), so they coalesce with live requests for the same topic.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+from app import router
+from app.bookshelf import clean_topics
+from app.ratelimit import RateLimited
+
+JOBS_UPSTREAM_PER_MIN = float(os.environ.get("JOBS_UPSTREAM_PER_MIN", "30"))
+JOBS_HISTORY = int(os.environ.get("JOBS_HISTORY", "200"))
+JOBS_MAX_PENDING = int(os.environ.get("JOBS_MAX_PENDING", "50"))  # queued + running + scheduled
+JOBS_MIN_EVERY_S = 60  # shortest allowed schedule
+
+
+class JobsFull(Exception):
+    """Too many queued or scheduled jobs; retry once some have finished or been cancelled."""
+
+
+class Job:
+    """One refresh ("refresh": always re-fetch) or warm ("warm": fetch only topics not already cached) run."""
+
+    def __init__(self, kind: str, topics: List[str], per_topic: int, every: Optional[float] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.topics = topics
+        self.per_topic = per_topic
+        self.every = every
+        self.status = "queued"
+        self.done = 0
+        self.upstream_calls = 0
+        self.skipped_cached = 0
+        self.errors: List[dict] = []
+        self.runs = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.next_run_at: Optional[float] = time.time()
+        self.cancelled = False
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "topics": self.topics,
+            "per_topic": self.per_topic,
+            "progress": {"done": self.done, "total": len(self.topics)},
+            "upstream_calls": self.upstream_calls,
+            "skipped_cached": self.skipped_cached,
+            "errors": self.errors,
+            "runs": self.runs,
+            "every_seconds": self.every,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "next_run_at": self.next_run_at if self.every and not self.cancelled else None,
+        }
+
+
+def _is_pending(job: Job) -> bool:
+    """Queued, running or scheduled to run again."""
+    return not job.cancelled and bool(job.every or job.status in ("queued", "running"))
+
+
+class JobRunner:
+    def __init__(self, upstream_per_min: float = JOBS_UPSTREAM_PER_MIN, history: int = JOBS_HISTORY,
+                 max_pending: int = JOBS_MAX_PENDING):
+        self.min_interval = 60.0 / upstream_per_min if upstream_per_min > 0 else 0.0
+        self.history = history
+        self.max_pending = max_pending
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._heap: list = []  # (run_at, seq, job)
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._last_upstream = 0.0
+        self._event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """The event loop serving requests (set at app startup, None at shutdown); job searches are run on it."""
+        self._event_loop = loop
+
+    def submit(self, kind: str, topics: List[str], per_topic: int = 3, every: Optional[float] = None) -> Job:
+        topics = clean_topics(topics)
+        if every is not None:
+            every = max(float(every), JOBS_MIN_EVERY_S)
+        job = Job(kind, topics, per_topic, every)
+        with self._cv:
+            if self._pending() >= self.max_pending:
+                raise JobsFull(f"{self.max_pending} jobs already queued or scheduled")
+            self.jobs[job.id] = job
+            excess = len(self.jobs) - self.history
+            if excess > 0:  # forget the oldest finished jobs; pending ones (at most max_pending) are kept
+                for old_id in [i for i, j in self.jobs.items() if not _is_pending(j) and j.status != "running"][:excess]:
+                    self.jobs.pop(old_id)
+            heapq.heappush(self._heap, (job.next_run_at, next(self._seq), job))
+            self._ensure_worker()
+            self._cv.notify()
+        return job
+
+    def _pending(self) -> int:
+        # Caller holds the lock.
+        return sum(1 for j in self.jobs.values() if _is_pending(j))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Stop a job: a queued run is dropped, a running one stops after the current topic, schedules end."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            with self._cv:
+                job.cancelled = True
+                if job.status in ("queued", "scheduled"):
+                    job.status = "cancelled"
+                self._heap = [entry for entry in self._heap if entry[2] is not job]  # its next run, if any
+                heapq.heapify(self._heap)
+        return job
+
+    def _ensure_worker(self) -> None:
+        # Caller holds the lock.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="bookshelf-jobs", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cv.wait(timeout=(self._heap[0][0] - time.time()) if self._heap else None)
+                _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            self._run(job)
+            if job.every and not job.cancelled:
+                job.next_run_at = time.time() + job.every
+                with self._cv:
+                    heapq.heappush(self._heap, (job.next_run_at, next(self._seq), job))
+
+    def _pace(self) -> None:
+        """Spend one unit of the upstream budget (sleep until the next call is allowed)."""
+        wait_s = self._last_upstream + self.min_interval - time.monotonic()
+        if wait_s > 0:
+            time.sleep(wait_s)
+        self._last_upstream = time.monotonic()
+
+    def _search(self, topic: str, per_topic: int, skip_cache: bool) -> List[dict]:
+        coro = router.search_topic_async(topic, max_results=per_topic, skip_cache=skip_cache)
+        if self._event_loop is None:  # no app running (e.g. a script): a private loop, nothing to share with
+            return asyncio.run(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self._event_loop).result()
+
+    def _run(self, job: Job) -> None:
+        job.status = "running"
+        job.runs += 1
+        job.done = 0
+        job.errors = []
+        job.started_at = time.time()
+        job.finished_at = None
+        for topic in job.topics:
+            if job.cancelled:
+                break
+            if job.kind == "warm" and router.peek_topic(topic, max_results=job.per_topic) is not None:
+                job.skipped_cached += 1
+            else:
+                self._pace()
+                job.upstream_calls += 1
+                try:
+                    items = self._search(topic, job.per_topic, skip_cache=job.kind == "refresh")
+                except RateLimited as e:
+                    items = [{"title": "Error", "snippet": str(e)}]
+                except Exception as e:  # e.g. cancelled by the app's loop shutting down: keep the worker alive
+                    items = [{"title": "Error", "snippet": str(e) or type(e).__name__}]
+                if items and items[0].get("title") == "Error":
+                    job.errors.append({"topic": topic, "error": items[0].get("snippet", "")})
+            job.done += 1
+        job.finished_at = time.time()
+        if job.cancelled:
+            job.status = "cancelled"
+        else:
+            job.status = "scheduled" if job.every else ("failed" if job.errors and len(job.errors) == len(job.topics) else "done")
+
+    def stats(self) -> dict:
+        with self._cv:
+            statuses = [j.status for j in self.jobs.values()]
+            return {
+                "queued_runs": sum(1 for _, _, j in self._heap if not j.cancelled),
+                "running": statuses.count("running"),
+                "scheduled": sum(1 for j in self.jobs.values() if j.every and not j.cancelled),
+                "upstream_per_min": round(60.0 / self.min_interval, 1) if self.min_interval else None,
+                "known_jobs": len(self.jobs),
+                "pending": self._pending(),
+                "max_pending": self.max_pending,
+            }
+
+
+job_runner = JobRunner()
@@ -1,35 +1,72 @@
 from dbm import error
 from typing import Optional
-from fastapi import  Body, FastAPI, Response, status, HTTPException, Depends
+from fastapi import  Body, FastAPI, Query, Request, Response, status, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from random import randrange
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 import time
+import threading
+from contextlib import asynccontextmanager
+import sqlalchemy.exc
 from sqlalchemy.orm import Session
-from app.database import Base ,engine, get_db
+# .env is loaded by app/__init__.py, before any app.* module below reads its settings.
+from app.database import get_db, get_conn, get_pool_stats, pg_pool, PoolTimeout, SessionLocal, \
+    DatabaseNotReady, close_db, db_status, ensure_db_ready, start_db_init, wait_for_db
+from app.cache_store import SEARCH_CACHE_PERSIST
 from app import models  # ensures Post is registered # ensures Post is registered
+from app.speech import SpeechUnavailable, audio_cache, get_or_render_async, get_speech_stats, normalize_text, prerender_async, \
+    split_sentences, stream_speech_async, synthesize_async
+import asyncio
+import json
+import math
 import os
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
-# Use Exa when EXA_API_KEY is set, else DuckDuckGo
-_SEARCH_BACKEND = "duckduckgo"
-try:
-    if os.environ.get("EXA_API_KEY"):
-        from app.search_exa import search_topic, search_youtube, get_bookshelf_resources, get_cache_stats
-        _SEARCH_BACKEND = "exa"
-    else:
-        from app.search import search_topic, search_youtube, get_bookshelf_resources, get_cache_stats
-except ImportError:
-    from app.search import search_topic, search_youtube, get_bookshelf_resources, get_cache_stats
-
-Base.metadata.create_all(bind=engine)# create the tables in the database, if they do not exist already.
-
-app = FastAPI()
+import re
+# Exa is primary when EXA_API_KEY is set, else DuckDuckGo; app/router.py hedges to the other and trips a circuit breaker.
+# Search and speech endpoints are async: upstream calls run on bounded per-backend pools and are awaited on the
+# event loop, so slow upstreams no longer tie up Starlette's threadpool (which still serves /vibe, /posts, ...).
+from app.router import search_topic_async, search_youtube_async, get_bookshelf_async, stream_bookshelf_async, \
+    get_cache_stats, get_router_stats, warm_backend, warm_cache
+from app.router import PRIMARY as _SEARCH_BACKEND
+from app.jobs import JobsFull, job_runner
+from app.ratelimit import SPEECH_RATE_LIMIT_KEY_HEADER, RateLimited, speech_limiter
+from app.metrics import MetricsMiddleware, render as render_metrics
+from app.responses import FastJSONResponse, json_response, search_cache_control
+from app.cache import track_freshness
+
+# Startup state for /readyz. Nothing at import time touches the network or the database.
+READINESS_REQUIRES_DB = os.environ.get("READINESS_REQUIRES_DB", "").lower() in ("1", "true", "yes")
+_startup = {"search_ready": False, "started_at": None}
+
+
+def _warm_search() -> None:
+    """Import the search client and load the persistent cache tier; search endpoints serve meanwhile."""
+    db_was_ready = db_status["ready"]
+    try:
+        warm_backend()
+        warm_cache()
+    except Exception as e:
+        print("Search warm-up failed (search still served lazily):", e)
+    _startup["search_ready"] = True
+    if SEARCH_CACHE_PERSIST == "postgres" and not db_was_ready and wait_for_db():
+        warm_cache()  # the postgres tier only opens once the background DB init has connected
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _startup["started_at"] = time.time()
+    # create the tables in the database, if they do not exist already (background, retried with backoff).
+    start_db_init()
+    threading.Thread(target=_warm_search, name="search-warm", daemon=True).start()
+    job_runner.bind_loop(asyncio.get_running_loop())  # background jobs search on this loop
+    yield
+    job_runner.bind_loop(None)
+    close_db()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Allow Next.js frontend (and Vercel preview) to call this API from the browser
 app.add_middleware(
@@ -38,12 +75,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-route latency / in-flight for /metrics; "X-Profile: 1" adds a Server-Timing header (app/metrics.py)
+app.add_middleware(MetricsMiddleware)
 
 # ---- Person 3: Web Scraper Agent (bookshelf) ----
 class BookshelfRequest(BaseModel):
     topics: list[str]
     per_topic: int = 3
+    deadline: float | None = None  # seconds; None = BOOKSHELF_DEADLINE_S, 0 = wait for every topic
+    local_first: bool = False  # answer from the local resource index when it has enough hits
+
+
+class WarmRequest(BaseModel):
+    """Topics to keep warm, e.g. an upcoming lesson's. every_seconds repeats the refresh on a schedule."""
+    topics: list[str]
+    per_topic: int = 3
+    every_seconds: float | None = None  # None = run once; minimum 60
+    refresh: bool = False  # re-fetch even topics that are already cached
 
 
 class SpeechRequest(BaseModel):
@@ -52,81 +102,299 @@ class SpeechRequest(BaseModel):
     lang: str = "en"
 
 
+class PrerenderRequest(BaseModel):
+    """Lines of NPC dialogue to synthesize ahead of a lesson."""
+    lines: list[str]
+    lang: str = "en"
+
+
+def _readiness() -> tuple[bool, dict]:
+    checks = {"search": _startup["search_ready"], "db": db_status["ready"]}
+    ready = checks["search"] and (checks["db"] or not READINESS_REQUIRES_DB)
+    return ready, checks
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving. Never touches the database or upstream APIs."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+def readyz(response: Response):
+    """Readiness: 503 until startup warm-up is done (and the database is up, if READINESS_REQUIRES_DB)."""
+    ready, checks = _readiness()
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ready, "checks": checks, "db": db_status, "requires_db": READINESS_REQUIRES_DB}
+
+
 @app.get("/vibe")
 def vibe():
-    """Health / vibe check: backend in use, cache stats."""
+    """Health / vibe check: backend in use and health, search and speech cache stats."""
     cache = get_cache_stats()
     message = "Exa is powering the bookshelf. Cache is saving your quota." if _SEARCH_BACKEND == "exa" else "DuckDuckGo fallback is active. Set EXA_API_KEY for Exa."
-    return {"status": "chill", "ready": True, "backend": _SEARCH_BACKEND, "cache": cache, "message": message}
+    return {"status": "chill", "ready": _readiness()[0], "db_ready": db_status["ready"], "backend": _SEARCH_BACKEND, "cache": cache, "speech_cache": get_speech_stats(), "db_pool": get_pool_stats(), "search_backends": get_router_stats(), "jobs": job_runner.stats(), "speech_rate_limit": speech_limiter.stats(), "message": message}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: route and upstream latency histograms, DB timings, cache/pool/limiter gauges."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _search_headers(items: list, ttls: list) -> str:
+    """Cacheable until the soonest-expiring cached answer used (ttls, from track_freshness) goes stale.
+    no-store if the answer is incomplete (errors, deadline, rate limit) or any part of it did not come from
+    the search cache (local index answers for local_first or while rate limited)."""
+    if any(item.get("title") == "Error" for item in items) or not ttls or None in ttls:
+        return "no-store"
+    return search_cache_control(min(ttls))
 
 
 @app.get("/search")
-def search(
+async def search(
+    request: Request,
     topic: str = "merge sort algorithm",
     max_results: int = 5,
     content_type: str | None = None,
+    local_first: bool = False,
 ):
-    """Single-topic search. content_type=video for YouTube/videos only."""
-    results = search_topic(topic, max_results=max_results)
+    """Single-topic search. content_type=video for YouTube/videos only.
+    local_first=true answers from the local index of past results when it has enough matches.
+    Sent with an ETag (If-None-Match -> 304) and Cache-Control following the cached entry's remaining TTL."""
+    with track_freshness() as ttls:
+        results = await search_topic_async(topic, max_results=max_results, local_first=local_first)
+    cache_control = _search_headers(results, ttls)
     if content_type:
         results = [r for r in results if r.get("type") == content_type]
-    return {"topic": topic, "results": results}
+    return json_response(request, {"topic": topic, "results": results}, cache_control=cache_control)
 
 
 @app.get("/search/youtube")
-def search_youtube_endpoint(topic: str = "quadratic equation tutorial", max_results: int = 5):
+async def search_youtube_endpoint(request: Request, topic: str = "quadratic equation tutorial", max_results: int = 5):
     """Search YouTube only."""
-    return {"topic": topic, "results": search_youtube(topic, max_results=max_results)}
+    with track_freshness() as ttls:
+        results = await search_youtube_async(topic, max_results=max_results)
+    return json_response(request, {"topic": topic, "results": results}, cache_control=_search_headers(results, ttls))
 
 
 @app.get("/bookshelf")
-def bookshelf(
+async def bookshelf(
+    request: Request,
     topics: str = "merge sort,binary search,divide and conquer",
     per_topic: int = 3,
     content_type: str | None = None,
+    deadline: float | None = None,
+    local_first: bool = False,
 ):
-    """Resources for 3D bookshelf. content_type=video for YouTube only."""
+    """Resources for 3D bookshelf. content_type=video for YouTube only.
+    Topics not done by the deadline are listed in pending_topics (partial=true); retry to pick them up.
+    Complete shelves carry an ETag and Cache-Control, so repeat loads are answered by the browser/edge or with a 304."""
     topic_list = [t.strip() for t in topics.split(",") if t.strip()]
-    resources = get_bookshelf_resources(topic_list, per_topic=per_topic)
+    with track_freshness() as ttls:
+        shelf = await get_bookshelf_async(topic_list, per_topic=per_topic, deadline=deadline, local_first=local_first)
+    cache_control = "no-store" if shelf["partial"] else _search_headers(shelf["resources"], ttls)
     if content_type:
-        resources = [r for r in resources if r.get("type") == content_type]
-    return {"resources": resources}
+        shelf["resources"] = [r for r in shelf["resources"] if r.get("type") == content_type]
+    return json_response(request, shelf, cache_control=cache_control)
 
 
 @app.post("/bookshelf")
-def bookshelf_post(body: BookshelfRequest, content_type: str | None = None):
+async def bookshelf_post(body: BookshelfRequest, request: Request, content_type: str | None = None):
     """Same as GET but topics in body. Add ?content_type=video for YouTube only."""
-    resources = get_bookshelf_resources(body.topics, per_topic=body.per_topic)
+    shelf = await get_bookshelf_async(body.topics, per_topic=body.per_topic, deadline=body.deadline, local_first=body.local_first)
     if content_type:
-        resources = [r for r in resources if r.get("type") == content_type]
-    return {"resources": resources}
+        shelf["resources"] = [r for r in shelf["resources"] if r.get("type") == content_type]
+    return json_response(request, shelf, etag=False)
+
+
+async def _bookshelf_events(events, content_type: str | None, fmt: str):
+    async for ev in events:
+        if ev["type"] == "topic" and content_type:
+            ev["resources"] = [r for r in ev["resources"] if r.get("type") == content_type]
+        data = json.dumps(ev)
+        yield f"event: {ev['type']}\ndata: {data}\n\n" if fmt == "sse" else data + "\n"
+
+
+@app.get("/bookshelf/stream")
+async def bookshelf_stream(
+    topics: str = "merge sort,binary search,divide and conquer",
+    per_topic: int = 3,
+    content_type: str | None = None,
+    deadline: float | None = None,
+    local_first: bool = False,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+):
+    """Streaming bookshelf: one record per topic as soon as it resolves (cached topics first), then a
+    "done" record with timing, cache hits and pending topics. format=sse for EventSource clients."""
+    topic_list = [t.strip() for t in topics.split(",") if t.strip()]
+    events = stream_bookshelf_async(topic_list, per_topic=per_topic, deadline=deadline, local_first=local_first)
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_bookshelf_events(events, content_type, format), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/bookshelf/stream")
+async def bookshelf_stream_post(body: BookshelfRequest, content_type: str | None = None,
+                          format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    """Same as GET /bookshelf/stream but topics in body."""
+    events = stream_bookshelf_async(body.topics, per_topic=body.per_topic, deadline=body.deadline, local_first=body.local_first)
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_bookshelf_events(events, content_type, format), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.exception_handler(JobsFull)
+def jobs_full_handler(request: Request, exc: JobsFull):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)},
+                        headers={"Retry-After": "60"})
+
+
+def _job_accepted(job, response: Response) -> dict:
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
 
 
 @app.post("/bookshelf/refresh")
-def bookshelf_refresh(body: BookshelfRequest):
-    """Re-fetch resources (bypass cache)."""
-    return {"resources": get_bookshelf_resources(body.topics, per_topic=body.per_topic, skip_cache=True)}
+def bookshelf_refresh(body: BookshelfRequest, response: Response):
+    """Queue a re-fetch of the topics (bypass cache) and return a job id straight away; poll /jobs/{job_id}.
+    Fresh results are written through to the persistent cache tier."""
+    return _job_accepted(job_runner.submit("refresh", body.topics, per_topic=body.per_topic), response)
+
+
+@app.post("/bookshelf/warm")
+def bookshelf_warm(body: WarmRequest, response: Response):
+    """Pre-fetch topics that are not cached yet (refresh=true: all of them), optionally every N seconds.
+    Upstream calls are paced to JOBS_UPSTREAM_PER_MIN."""
+    kind = "refresh" if body.refresh else "warm"
+    job = job_runner.submit(kind, body.topics, per_topic=body.per_topic, every=body.every_seconds)
+    return _job_accepted(job, response)
+
+
+@app.get("/jobs")
+def list_jobs():
+    """Recent and scheduled bookshelf jobs, newest first."""
+    return {"jobs": [j.to_dict() for j in reversed(list(job_runner.jobs.values()))], "stats": job_runner.stats()}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Progress of a refresh/warm job."""
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"job {job_id} not found")
+    return job.to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a job: stops its schedule and any remaining topics."""
+    job = job_runner.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"job {job_id} not found")
+    return job.to_dict()
 
 
 # ---- Person 3: NPC speech (TTS) ----
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"  # content-addressed, never changes
+
+
+def _client_key(request: Request) -> str:
+    """Who a request is from: the first address in SPEECH_RATE_LIMIT_KEY_HEADER if set (behind the edge), else the peer IP."""
+    if SPEECH_RATE_LIMIT_KEY_HEADER:
+        forwarded = request.headers.get(SPEECH_RATE_LIMIT_KEY_HEADER, "").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else "unknown"
+
+
+def speech_rate_limit(request: Request, cost: int = 1) -> None:
+    """Per-client token bucket for the TTS endpoints (SPEECH_RATE_LIMIT_PER_MIN / _BURST).
+    cost is what the request may render (lines, sentence chunks); raises RateLimited -> 429."""
+    speech_limiter.check(_client_key(request), cost=max(1, cost))
+
+
+def _audio_file(path, headers: dict, validators: bool = True) -> Optional[Response]:
+    """Serve a cached MP3 (sendfile where the server supports it); validators=False drops FileResponse's own
+    ETag/Last-Modified. None if the file is gone (evicted from the shared directory before it could be sent)."""
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    response = FileResponse(path, media_type="audio/mpeg", headers=headers, stat_result=stat_result)
+    if not validators:
+        for name in ("etag", "last-modified"):
+            if name in response.headers:
+                del response.headers[name]
+    return response
+
+
 @app.post("/speech", response_class=Response)
-def speech(body: SpeechRequest):
-    """Text-to-speech: send text, get back audio (MP3). Uses gTTS. Body: {"text": "...", "lang": "en"}."""
+async def speech(body: SpeechRequest, request: Request):
+    """Text-to-speech: send text, get back audio (MP3). Uses gTTS. Body: {"text": "...", "lang": "en"}.
+    Audio is cached on disk by hash of (text, lang), so repeated NPC lines skip gTTS.
+    POST responses are not cached: Content-Location points at the cacheable GET /speech/audio/{key}."""
+    text = normalize_text(body.text)
+    if not text:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="text is required and cannot be empty")
+    speech_rate_limit(request)
     try:
-        from gtts import gTTS
-    except ImportError:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="gTTS not installed. pip install gtts")
-    text = (body.text or "").strip()
+        path, key, _ = await get_or_render_async(text, body.lang)
+        headers = {"Content-Location": f"/speech/audio/{key}"}
+        response = _audio_file(path, headers, validators=False)
+        if response is None:
+            response = Response(await synthesize_async(text, body.lang), media_type="audio/mpeg", headers=headers)
+    except SpeechUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"TTS failed: {e}")
+    return response
+
+
+@app.post("/speech/stream", response_class=StreamingResponse)
+async def speech_stream(body: SpeechRequest, request: Request):
+    """Streaming TTS for long NPC text: split into sentences, synthesized concurrently, MP3 streamed in order.
+    Playback can start after the first sentence instead of the whole passage."""
+    text = normalize_text(body.text)
     if not text:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="text is required and cannot be empty")
-    if len(text) > 2000:
-        text = text[:2000] + "."
-    tts = gTTS(text=text, lang=body.lang, slow=False)
-    import io
-    buf = io.BytesIO()
-    tts.write_to_fp(buf)
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="audio/mpeg")
+    speech_rate_limit(request, cost=len(split_sentences(text)))  # one token per gTTS chunk
+    try:
+        frames = await stream_speech_async(text, body.lang)
+    except SpeechUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"TTS failed: {e}")
+    return StreamingResponse(frames, media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/speech/audio/{key}", response_class=Response)
+def speech_audio(key: str, request: Request):
+    """Fetch pre-rendered audio by key (from /speech/prerender). Browser/CDN cacheable: ETag (If-None-Match -> 304)
+    and an immutable Cache-Control, since the key is a hash of the content."""
+    if not re.fullmatch(r"[0-9a-f]{64}", key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="unknown audio key")
+    headers = {"ETag": f'"{key}"', "Cache-Control": AUDIO_CACHE_CONTROL}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    path = audio_cache.get(key)
+    response = _audio_file(path, headers) if path is not None else None
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="audio not rendered (or evicted)")
+    return response
+
+
+@app.post("/speech/prerender")
+async def speech_prerender(body: PrerenderRequest, request: Request):
+    """Synthesize a lesson's dialogue ahead of time. Returns a key/url per line for /speech/audio/{key}."""
+    if len(body.lines) > 500:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="at most 500 lines per request")
+    speech_rate_limit(request, cost=len(body.lines))  # one token per line
+    results = await prerender_async(body.lines, lang=body.lang)
+    return {"results": results, "rendered": sum(1 for r in results if r.get("cached") is False),
+            "cached": sum(1 for r in results if r.get("cached") is True),
+            "errors": sum(1 for r in results if "error" in r)}
 
 
 # title string content string, we can use pydantic to create a model for the post, and then use that model to validate the data that is sent to the server. This way we can ensure that the data is in the correct format and that it contains all the required fields.
@@ -136,17 +404,28 @@ class Post(BaseModel):
     published: bool = True # default value is true, if the user does not provide a value for published, it will be set to true by default.
     #rating: Optional[int] = None
 
-while True:
-    try :
-        conn = psycopg2.connect(host='localhost', database='Fastapi', user='postgres',
-                             password='52236385', cursor_factory=RealDictCursor)
-        cursor = conn.cursor() # cursor is used to execute SQL commands and fetch data from the database. 
-        print("Database connection successful")
-        break
-    except Exception as error:
-        print("Database connection failed")
-        print("Error: ",error)
-        time.sleep(2)
+# Raw-SQL endpoints borrow a connection per request from the bounded pool in app/database.py (get_conn).
+# A psycopg2 connection's cursor is not safe to share between the threadpool's requests.
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)},
+                        headers={"Retry-After": "1"})
+
+
+@app.exception_handler(RateLimited)
+def rate_limited_handler(request: Request, exc: RateLimited):
+    # Search backends over budget (and nothing cached to fall back on), or a client over the speech limit.
+    return JSONResponse(status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": str(exc)},
+                        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+
+@app.exception_handler(DatabaseNotReady)
+@app.exception_handler(psycopg2.OperationalError)
+@app.exception_handler(sqlalchemy.exc.OperationalError)
+def db_unavailable_handler(request: Request, exc: Exception):
+    # Database still starting (or went away): only the DB endpoints fail, search keeps serving.
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": f"database unavailable: {str(exc).strip()}"}, headers={"Retry-After": "2"})
 
 my_posts = [{"title": "post1", "content": "content1", "published": True, "rating": 5, "id": 1},
             {"title": "post2", "content": "content2", "published": False, "rating": 4, "id": 2}]
@@ -162,34 +441,203 @@ def find_index_post(id):
         if post['id'] == id:
             return index
 
+POSTS_PAGE_DEFAULT = 100
+POSTS_PAGE_MAX = 1000
+
+
+def _stream_posts_ndjson(after_id: int, limit: int | None):
+    """One JSON row per line from a server-side (named) cursor, so a full export uses constant memory.
+    Borrows its own pooled connection: the generator runs after the endpoint has returned."""
+    with pg_pool.connection() as conn:
+        with conn.cursor(name="posts_export") as cursor:
+            cursor.itersize = 500  # rows fetched from Postgres per round trip
+            if limit is None:
+                cursor.execute("SELECT * FROM post WHERE id > %s ORDER BY id", (after_id,))
+            else:
+                cursor.execute("SELECT * FROM post WHERE id > %s ORDER BY id LIMIT %s", (after_id, limit))
+            for row in cursor:
+                yield json.dumps(row, default=str) + "\n"
+
+
 @app.get("/posts") #read
-def read_root():
-    cursor.execute("SELECT * FROM post")
-    posts = cursor.fetchall()
-    return {"data": posts}
+def read_root(
+    after_id: int = 0,
+    limit: int | None = Query(None, ge=1, le=POSTS_PAGE_MAX),
+    stream: bool = False,
+):
+    # keyset pagination: pass next_cursor back as after_id to get the next page (no OFFSET scans).
+    # stream=true returns NDJSON for the whole table (or up to limit rows) instead of a page.
+    ensure_db_ready()  # fail with 503 up front rather than mid-stream
+    if stream:
+        return StreamingResponse(_stream_posts_ndjson(after_id, limit), media_type="application/x-ndjson")
+    limit = limit or POSTS_PAGE_DEFAULT
+    with pg_pool.connection() as conn:
+        with conn.cursor() as cursor: # cursor is used to execute SQL commands and fetch data from the database.
+            cursor.execute("SELECT * FROM post WHERE id > %s ORDER BY id LIMIT %s", (after_id, limit))
+            posts = cursor.fetchall()
+    next_cursor = posts[-1]["id"] if len(posts) == limit else None
+    return {"data": posts, "next_cursor": next_cursor}
+
+
+def _post_to_dict(post: models.Post) -> dict:
+    return {"id": post.id, "title": post.title, "content": post.content, "published": post.published}
+
+
+def _stream_sqlalchemy_ndjson(after_id: int, limit: int | None):
+    """Same as _stream_posts_ndjson through the ORM: stream_results + yield_per keep memory flat."""
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(models.Post)
+            .filter(models.Post.id > after_id)
+            .order_by(models.Post.id)
+            .execution_options(stream_results=True)
+            .yield_per(500)
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        for post in query:
+            yield json.dumps(_post_to_dict(post)) + "\n"
+    finally:
+        db.close()
+
 
 @app.get("/sqlalchemy") #read
-def test_post(db: Session = Depends(get_db)):
-    posts = db.query(models.Post).all()
-    return {"data": posts}
+def test_post(
+    after_id: int = 0,
+    limit: int | None = Query(None, ge=1, le=POSTS_PAGE_MAX),
+    stream: bool = False,
+    db: Session = Depends(get_db),
+):
+    ensure_db_ready()
+    if stream:  # the stream outlives the request's session, so it opens its own
+        return StreamingResponse(_stream_sqlalchemy_ndjson(after_id, limit), media_type="application/x-ndjson")
+    limit = limit or POSTS_PAGE_DEFAULT
+    posts = db.query(models.Post).filter(models.Post.id > after_id).order_by(models.Post.id).limit(limit).all()
+    data = [_post_to_dict(p) for p in posts]
+    next_cursor = data[-1]["id"] if len(data) == limit else None
+    return {"data": data, "next_cursor": next_cursor}
 
 @app.post("/posts", status_code=status.HTTP_201_CREATED)#Create
 #By default, FastAPI will return a 200 status code for successful requests,
 #but we can specify a different status code using the status_code parameter in the decorator.
 #In this case, we are specifying that the status code should be 201 Created
-def create_post(new_post: Post ):
+def create_post(new_post: Post, conn=Depends(get_conn)):
     #print(new_post)
     #print(new_post.dict())
     #new_post_dict = new_post.dict()
     #new_post_dict['id'] = randrange(0, 1000000)
     #my_posts.append(new_post_dict)
     
-    new_post  = cursor.execute("INSERT INTO post (title, content, published) VALUES (%s, %s, %s)" \
-    " RETURNING *", (new_post.title, new_post.content, new_post.published) )
-    created_post = cursor.fetchone()
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO post (title, content, published) VALUES (%s, %s, %s)" \
+        " RETURNING *", (new_post.title, new_post.content, new_post.published) )
+        created_post = cursor.fetchone()
     conn.commit()#commit the changes to the database, if we do not commit the changes, they will not be saved to the database.
     return {"data": created_post}
 
+# ---- bulk endpoints: one transaction and multi-row statements per batch (seeding lesson content) ----
+POSTS_BATCH_MAX = 5000
+
+
+class PostUpdate(Post):
+    id: int
+
+
+class PostIds(BaseModel):
+    ids: list[int]
+
+
+def _validate_batch(items: list, model) -> tuple[list, list]:
+    """Validate each item on its own so one bad item is reported instead of failing the request."""
+    if len(items) > POSTS_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"at most {POSTS_BATCH_MAX} items per batch")
+    valid, errors = [], []
+    for i, raw in enumerate(items):
+        try:
+            valid.append((i, model.model_validate(raw)))
+        except ValidationError as e:
+            errors.append({"index": i, "error": e.errors(include_url=False, include_context=False)})
+    return valid, errors
+
+
+def _execute_batch(conn, sql: str, rows: list, template: str) -> tuple[list, list]:
+    """Run sql once for all rows (execute_values). If that fails, redo it row by row under savepoints
+    so only the offending rows are reported. rows: [(index, values tuple)]. Returns (returned rows, errors)."""
+    if not rows:
+        return [], []
+    with conn.cursor() as cursor:
+        cursor.execute("SAVEPOINT batch")
+        try:
+            returned = execute_values(cursor, sql, [r for _, r in rows], template=template, page_size=1000, fetch=True)
+            cursor.execute("RELEASE SAVEPOINT batch")
+            return returned, []
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK TO SAVEPOINT batch")
+        returned, errors = [], []
+        for index, row in rows:
+            cursor.execute("SAVEPOINT batch_row")
+            try:
+                returned.extend(execute_values(cursor, sql, [row], template=template, fetch=True))
+                cursor.execute("RELEASE SAVEPOINT batch_row")
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT batch_row")
+                errors.append({"index": index, "error": str(e).strip()})
+        return returned, errors
+
+
+@app.post("/posts/batch", status_code=status.HTTP_201_CREATED)#Create many
+def create_posts_batch(items: list[dict] = Body(...), conn=Depends(get_conn)):
+    valid, errors = _validate_batch(items, Post)
+    created, db_errors = _execute_batch(
+        conn,
+        "INSERT INTO post (title, content, published) VALUES %s RETURNING *",
+        [(i, (p.title, p.content, p.published)) for i, p in valid],
+        template="(%s, %s, %s)",
+    )
+    conn.commit()
+    return {"data": created, "errors": sorted(errors + db_errors, key=lambda e: e["index"])}
+
+
+@app.put("/posts/batch")#Update many
+def update_posts_batch(items: list[dict] = Body(...), conn=Depends(get_conn)):
+    valid, errors = _validate_batch(items, PostUpdate)
+    seen, rows = set(), []
+    for i, p in valid:
+        if p.id in seen:
+            errors.append({"index": i, "error": f"duplicate id {p.id} in batch"})
+            continue
+        seen.add(p.id)
+        rows.append((i, (p.id, p.title, p.content, p.published)))
+    updated, db_errors = _execute_batch(
+        conn,
+        "UPDATE post SET title = v.title, content = v.content, published = v.published "
+        "FROM (VALUES %s) AS v (id, title, content, published) WHERE post.id = v.id RETURNING post.*",
+        rows,
+        template="(%s::int, %s, %s, %s::boolean)",
+    )
+    conn.commit()
+    found = {row["id"] for row in updated}
+    failed = {e["index"] for e in db_errors}
+    errors += db_errors + [{"index": i, "error": f"post with id {values[0]} not found"}
+                           for i, values in rows if values[0] not in found and i not in failed]
+    return {"data": updated, "errors": sorted(errors, key=lambda e: e["index"])}
+
+
+@app.delete("/posts/batch")#Delete many
+def delete_posts_batch(body: PostIds, conn=Depends(get_conn)):
+    if len(body.ids) > POSTS_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"at most {POSTS_BATCH_MAX} items per batch")
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM post WHERE id = ANY(%s) RETURNING id", (body.ids,))
+        deleted = [row["id"] for row in cursor.fetchall()]
+    conn.commit()
+    missing = set(body.ids) - set(deleted)
+    errors = [{"index": i, "error": f"post with id {id} not found"} for i, id in enumerate(body.ids) if id in missing]
+    return {"deleted": deleted, "errors": errors}
+
 @app.get("/posts/{id}")#get the id, Read
 def getpost(id: int, response: Response): # you can also use path parameters to get the id of the post, and then use that id to find the post in the list of posts.
     # if there is a route that has a string parameter, it will catch that route instead of this one,
@@ -211,21 +659,23 @@ def getpost(id: int, response: Response): # you can also use path parameters to
      
 
 @app.get("/items/{item_id}")
-def read_item(item_id: int, q: str | None = None):
+def read_item(item_id: int, q: str | None = None, conn=Depends(get_conn)):
     #need to be int because the id in the database is stored as an integer, 
     #and we need to match the data type of the id in the database with the data 
     # type of the item_id that we are passing to the function.
-    cursor.execute("SELECT * FROM post WHERE id = %s", (str(item_id),))
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT * FROM post WHERE id = %s", (str(item_id),))
     # we need to convert the item_id to a string because the id in the database is stored as a string,
     # and we need to match the data type of the id in the database with the data type of the item_id that we are passing to the function.
     return {"item_id": item_id, "q": q}
 
 @app.delete("/posts/{id}", status_code=status.HTTP_204_NO_CONTENT)#delete
-def delete_post(id: int):
+def delete_post(id: int, conn=Depends(get_conn)):
     #deleting a post
     #
-    cursor.execute("DELETE FROM post WHERE id = %s RETURNING *", (str(id),))
-    deleted_post = cursor.fetchone()
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM post WHERE id = %s RETURNING *", (str(id),))
+        deleted_post = cursor.fetchone()
     conn.commit()
 
     if deleted_post == None:
@@ -234,7 +684,7 @@ def delete_post(id: int):
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.put("/posts/{id}")#update
-def update_post(id: int, post: Post):
+def update_post(id: int, post: Post, conn=Depends(get_conn)):
     #index = find_index_post(id)
     #if index == None:
     #    raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT, 
@@ -242,9 +692,10 @@ def update_post(id: int, post: Post):
     #post_dict = post.dict()
     #post_dict['id'] = id
     #my_posts[index] = post_dict
-    cursor.execute("UPDATE post SET title = %s, content = %s, published = %s WHERE id = %s RETURNING *", 
-                   (post.title, post.content, post.published, str(id)))
-    updated_post = cursor.fetchone()
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE post SET title = %s, content = %s, published = %s WHERE id = %s RETURNING *", 
+                       (post.title, post.content, post.published, str(id)))
+        updated_post = cursor.fetchone()
     conn.commit()
     if updated_post == None:
         raise HTTPException(status_code=status.HTTP_418_IM_A_TEAPOT, 
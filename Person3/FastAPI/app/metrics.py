@@ -0,0 +1,230 @@
+"""
+FocusFlow 3D - Person 3: Prometheus metrics and per-request profiling.
+- MetricsMiddleware: latency histogram and in-flight gauge per route template (not raw path).
+- time_upstream(): DuckDuckGo text/videos, Exa search and gTTS timings, by outcome.
+- observe_db(): raw psycopg2 and SQLAlchemy query timings (hooked up in app/database.py).
+- Cache, rate limit, breaker and pool figures are read from the existing stats() at scrape time.
+GET /metrics serves the text exposition format; no client library needed.
+Profiling: send "X-Profile: 1" and the response carries a Server-Timing header (upstream and DB time
+spent by that request). With SLOW_REQUEST_MS set, slower requests are logged with the same breakdown.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))  # 0 = off
+PROFILE_HEADER = "x-profile"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Tuple[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    parts = [f'{n}="{_escape(v)}"' for n, v in pairs]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(items):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {_fmt_value(round(series[-2], 6))}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str) -> None:
+        self.inc(*labels, amount=-1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_value(v)}" for labels, v in items]
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency (until the last body byte) by route",
+                            ("method", "route", "status"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served by route", ("method", "route"))
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Upstream API call latency (DuckDuckGo, Exa, gTTS)",
+                             ("service", "operation", "outcome"))
+DB_LATENCY = Histogram("db_query_duration_seconds", "Database statement latency", ("driver", "statement"),
+                       buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+# Per-request profile: list of (segment, seconds), set by the middleware only when profiling.
+_profile: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_profile", default=None)
+
+
+def _record_segment(name: str, seconds: float) -> None:
+    segments = _profile.get()
+    if segments is not None:
+        segments.append((name, seconds))
+
+
+@contextmanager
+def time_upstream(service: str, operation: str):
+    """Time one upstream call: with time_upstream("exa", "search"): ..."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        seconds = time.perf_counter() - start
+        UPSTREAM_LATENCY.observe(seconds, service, operation, outcome)
+        _record_segment(f"{service}-{operation}", seconds)
+
+
+def observe_db(driver: str, sql, seconds: float) -> None:
+    """Record one statement; labelled by its verb (select/insert/...) to keep cardinality low."""
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    verb = str(sql).lstrip().split(None, 1)[0].lower() if str(sql).strip() else "other"
+    DB_LATENCY.observe(seconds, driver, verb)
+    _record_segment("db", seconds)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs tasks in the submitter's contextvars, so fan-out work is profiled too."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def server_timing(segments: List[tuple], total_s: float) -> str:
+    """Server-Timing header value: total plus time per upstream/DB segment (summed, with call counts)."""
+    totals: Dict[str, list] = {}
+    for name, seconds in segments:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = [f"total;dur={total_s * 1000:.1f}"]
+    parts += [f'{name};dur={s * 1000:.1f};desc="{n} call{"s" if n != 1 else ""}"' for name, (s, n) in totals.items()]
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (streams untouched): per-route latency/in-flight, optional Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route(scope) -> str:
+        from starlette.routing import Match
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "other")
+        return "unmatched"  # unknown paths share one series
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method, route = scope["method"], self._route(scope)
+        headers = dict(scope.get("headers") or [])
+        profiling = headers.get(PROFILE_HEADER.encode(), b"").lower() in (b"1", b"true", b"yes")
+        segments = [] if profiling or SLOW_REQUEST_MS > 0 else None
+        token = _profile.set(segments)
+        start = time.perf_counter()
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+                if profiling:
+                    value = server_timing(segments, time.perf_counter() - start).encode()
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", value)]}
+            await send(message)
+
+        IN_FLIGHT.inc(method, route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec(method, route)
+            REQUEST_LATENCY.observe(elapsed, method, route, str(status_code[0]))
+            _profile.reset(token)
+            if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+                print(f"Slow request {method} {scope['path']} {status_code[0]} {elapsed * 1000:.0f}ms:",
+                      server_timing(segments, elapsed))
+
+
+# Scrape-time collectors: functions returning exposition lines from existing stats() dicts.
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def collector(fn: Callable[[], List[str]]) -> Callable[[], List[str]]:
+    _collectors.append(fn)
+    return fn
+
+
+def stat_lines(name: str, kind: str, help: str, samples: List[Tuple[str, float]]) -> List[str]:
+    """Lines for one metric from (label string, value) pairs; None values are skipped."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{labels} {_fmt_value(v)}" for labels, v in samples if v is not None]
+    return lines
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in (REQUEST_LATENCY, IN_FLIGHT, UPSTREAM_LATENCY, DB_LATENCY):
+        lines += metric.render()
+    for fn in _collectors:
+        try:
+            lines += fn()
+        except Exception as e:
+            lines.append(f"# collector {fn.__name__} failed: {e}")
+    return "\n".join(lines) + "\n"
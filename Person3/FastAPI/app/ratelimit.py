@@ -0,0 +1,243 @@
+"""
+FocusFlow 3D - Person 3: outbound rate limits and quota accounting.
+One token bucket per search backend (RATE_LIMIT_<BACKEND>_PER_MIN / _BURST). A call that finds the bucket
+empty waits its turn for up to RATE_LIMIT_MAX_WAIT_MS, then gives up with RateLimited so the caller can
+serve stale cache, the local index or the other backend instead of an error. An optional quota
+(<BACKEND>_MONTHLY_QUOTA, e.g. EXA_MONTHLY_QUOTA) stops calls once the month's budget is spent.
+Usage is counted per minute (last hour) and per day (last 31 days) for /vibe. Counts, and so the monthly
+quota, are per process: they reset on restart and every worker has its own, so set the quota to the month's
+budget divided by the number of workers.
+Also a per-client limiter for the speech endpoints.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+DEFAULT_PER_MIN = {"duckduckgo": 30, "exa": 300}  # DuckDuckGo throttles hard; Exa allows ~5 req/s
+DEFAULT_BURST = {"duckduckgo": 5, "exa": 10}
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT_MS", "500")) / 1000
+SPEECH_RATE_PER_MIN = float(os.environ.get("SPEECH_RATE_LIMIT_PER_MIN", "30"))
+SPEECH_RATE_BURST = int(os.environ.get("SPEECH_RATE_LIMIT_BURST", "10"))
+# Header naming the client for the per-client limit, e.g. x-forwarded-for behind the Vercel edge (first hop is
+# used). Only set this behind a proxy that overwrites it; unset = the connection's IP.
+SPEECH_RATE_LIMIT_KEY_HEADER = os.environ.get("SPEECH_RATE_LIMIT_KEY_HEADER", "").strip().lower()
+
+
+class RateLimited(Exception):
+    """Over the rate limit or quota; retry_after is the suggested wait in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UsageMeter:
+    """Calls per minute (last 60 minutes), per day (last 31 days) and in the current calendar month (UTC)."""
+
+    def __init__(self):
+        self.per_minute: deque = deque(maxlen=60)  # [minute_start_epoch, count]
+        self.per_day: deque = deque(maxlen=31)  # [YYYY-MM-DD, count]
+        self.month = ""
+        self.month_total = 0
+        self.total = 0
+
+    def record(self, n: int = 1) -> None:
+        # Caller holds the owner's lock.
+        self.month_used()  # roll the month over first
+        now = time.time()
+        minute = int(now // 60 * 60)
+        if self.per_minute and self.per_minute[-1][0] == minute:
+            self.per_minute[-1][1] += n
+        else:
+            self.per_minute.append([minute, n])
+        day = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+        if self.per_day and self.per_day[-1][0] == day:
+            self.per_day[-1][1] += n
+        else:
+            self.per_day.append([day, n])
+        self.total += n
+        self.month_total += n
+
+    def month_used(self) -> int:
+        month = datetime.now(timezone.utc).strftime("%Y-%m")
+        if month != self.month:
+            self.month, self.month_total = month, 0
+        return self.month_total
+
+    def stats(self) -> dict:
+        cutoff = time.time() - 3600
+        return {
+            "total": self.total,
+            "last_hour": sum(c for m, c in self.per_minute if m >= cutoff),
+            "this_month": self.month_used(),
+            "per_minute": [{"minute": m, "calls": c} for m, c in self.per_minute if m >= cutoff],
+            "per_day": [{"day": d, "calls": c} for d, c in self.per_day],
+        }
+
+
+class TokenBucket:
+    """
+    rate_per_min tokens/minute, up to burst banked. Waiters reserve tokens in arrival order (the balance goes
+    negative), so the queue is FIFO and its length is bounded by max_wait. rate_per_min <= 0 means unlimited.
+    """
+
+    def __init__(self, name: str, rate_per_min: float, burst: int, max_wait: float = RATE_LIMIT_MAX_WAIT,
+                 monthly_quota: Optional[int] = None):
+        self.name = name
+        self.rate = rate_per_min / 60.0
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self.monthly_quota = monthly_quota
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.usage = UsageMeter()
+        self.granted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.quota_rejected = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: Optional[float] = None) -> float:
+        """Take one token without sleeping. Returns how long to wait before using it (0 = now); raises RateLimited
+        if that is longer than max_wait or the monthly quota is used up. Async callers asyncio.sleep the wait."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._lock:
+            if self.monthly_quota is not None and self.usage.month_used() >= self.monthly_quota:
+                self.quota_rejected += 1
+                now = datetime.now(timezone.utc)
+                next_month = datetime(now.year + now.month // 12, now.month % 12 + 1, 1, tzinfo=timezone.utc)
+                raise RateLimited(f"{self.name} monthly quota of {self.monthly_quota} calls used up",
+                                  retry_after=(next_month - now).total_seconds())
+            wait_s = 0.0
+            if self.rate > 0:
+                self._refill(time.monotonic())
+                if self.tokens < 1:
+                    wait_s = (1 - self.tokens) / self.rate
+                    if wait_s > max_wait:
+                        self.rejected += 1
+                        raise RateLimited(f"{self.name} rate limit reached", retry_after=wait_s)
+                    self.queued += 1
+                self.tokens -= 1
+            self.granted += 1
+            self.wait_seconds += wait_s
+            self.usage.record()
+        return wait_s
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """reserve() and sleep until the token is due. Returns the time waited; raises RateLimited."""
+        wait_s = self.reserve(max_wait)
+        if wait_s > 0:
+            time.sleep(wait_s)
+        return wait_s
+
+    def try_acquire(self, cost: float = 1) -> float:
+        """Take cost tokens now or not at all (no queueing). Returns 0.0 if taken, else seconds until they would be.
+        A cost above burst is let through on a full bucket and leaves it in debt (negative) until it is paid off."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            needed = min(cost, self.burst)
+            if self.tokens < needed:
+                self.rejected += 1
+                return (needed - self.tokens) / self.rate
+            self.tokens -= cost
+            self.granted += 1
+            self.usage.record(cost)
+        return 0.0
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """acquire() then fn(*args, **kwargs)."""
+        self.acquire()
+        return fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.rate > 0:
+                self._refill(time.monotonic())
+            return {
+                "rate_per_min": round(self.rate * 60, 2) if self.rate > 0 else None,
+                "burst": self.burst,
+                "tokens": round(max(self.tokens, 0.0), 2),
+                "max_wait_ms": self.max_wait * 1000,
+                "granted": self.granted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "quota_rejected": self.quota_rejected,
+                "avg_wait_ms": round(self.wait_seconds / self.queued * 1000, 1) if self.queued else 0.0,
+                "monthly_quota": self.monthly_quota,
+                "usage": self.usage.stats(),
+            }
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_limiter(backend: str) -> TokenBucket:
+    """The process-wide bucket for a backend, e.g. RATE_LIMIT_EXA_PER_MIN=300, RATE_LIMIT_EXA_BURST=10."""
+    with _buckets_lock:
+        if backend not in _buckets:
+            prefix = f"RATE_LIMIT_{backend.upper()}"
+            quota = os.environ.get(f"{backend.upper()}_MONTHLY_QUOTA")
+            _buckets[backend] = TokenBucket(
+                backend,
+                rate_per_min=float(os.environ.get(f"{prefix}_PER_MIN", DEFAULT_PER_MIN.get(backend, 60))),
+                burst=int(os.environ.get(f"{prefix}_BURST", DEFAULT_BURST.get(backend, 5))),
+                monthly_quota=int(quota) if quota else None,
+            )
+        return _buckets[backend]
+
+
+def get_rate_limit_stats() -> dict:
+    """Per-backend buckets and usage for /vibe."""
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {name: b.stats() for name, b in buckets.items()}
+
+
+class ClientRateLimiter:
+    """One token bucket per client key (IP or SPEECH_RATE_LIMIT_KEY_HEADER), no queueing: over the limit is rejected."""
+
+    def __init__(self, name: str, rate_per_min: float, burst: int, max_clients: int = 10000):
+        self.name = name
+        self.rate_per_min = rate_per_min
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def check(self, client: str, cost: int = 1) -> None:
+        """Spend cost tokens for client (one per line or chunk rendered); raises RateLimited without spending any if it cannot."""
+        if self.rate_per_min <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(f"{self.name}:{client}", self.rate_per_min, self.burst, max_wait=0)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client)
+        retry_after = bucket.try_acquire(cost)
+        if retry_after:
+            with self._lock:
+                self.rejected += 1
+            raise RateLimited(f"too many {self.name} requests, retry in {math.ceil(retry_after)}s", retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rate_per_min": self.rate_per_min, "burst": self.burst, "clients": len(self._buckets),
+                    "key": SPEECH_RATE_LIMIT_KEY_HEADER or "client_ip", "rejected": self.rejected}
+
+
+speech_limiter = ClientRateLimiter("speech", SPEECH_RATE_PER_MIN, SPEECH_RATE_BURST)
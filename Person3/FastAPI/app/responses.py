@@ -0,0 +1,102 @@
+"""
+FocusFlow 3D - Person 3: JSON responses for the read-heavy endpoints (/search, /bookshelf).
+- FastJSONResponse: orjson when it is installed (app default response class), stdlib json otherwise.
+- json_response(): ETag from the body (If-None-Match -> 304), brotli/gzip above COMPRESS_MIN_BYTES,
+  and a Cache-Control header (search_cache_control() follows the cached entry's remaining TTL) so browsers and
+  the Vercel edge can answer repeat loads. Streams and audio are left alone.
+"""
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.cache import CACHE_STALE_TTL, CACHE_TTL
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+# Browser/edge freshness for search results; defaults to the server-side cache TTL
+SEARCH_HTTP_MAX_AGE = int(float(os.environ.get("SEARCH_HTTP_MAX_AGE", str(CACHE_TTL))))
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def search_cache_control(ttl_left: float) -> str:
+    """
+    Fresh for as long as the server-side entry still is (ttl_left seconds, capped at SEARCH_HTTP_MAX_AGE);
+    the edge may serve it stale for as long as the server-side cache does. An answer already served
+    stale (ttl_left <= 0) is no-cache: clients revalidate, and the ETag turns that into a 304.
+    """
+    if ttl_left <= 0:
+        return "no-cache"
+    max_age = min(SEARCH_HTTP_MAX_AGE, int(ttl_left))
+    return f"public, max-age={max_age}, s-maxage={max_age}, stale-while-revalidate={int(CACHE_STALE_TTL)}"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): W/"x" matches "x".
+    tags = [t.strip() for t in if_none_match.split(",") if t.strip()]
+    return "*" in tags or any(t.removeprefix("W/") == etag.removeprefix("W/") for t in tags)
+
+
+def _pick_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def json_response(request: Request, content: Any, cache_control: Optional[str] = None, etag: bool = True,
+                  status_code: int = 200) -> Response:
+    """Serialize once, then 304 / compress / cache headers. The ETag is weak because it survives compression."""
+    body = dumps(content)
+    headers = {"Vary": "Accept-Encoding"}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if etag:
+        tag = 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        headers["ETag"] = tag
+        if request.method in ("GET", "HEAD") and _etag_matches(request.headers.get("if-none-match", ""), tag):
+            return Response(status_code=304, headers=headers)
+    encoding = _pick_encoding(request.headers.get("accept-encoding", "")) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,353 @@
+"""
+FocusFlow 3D - Person 3: search backend router.
+Primary backend is Exa when EXA_API_KEY is set, DuckDuckGo otherwise (as before); the other one is the secondary.
+- Health per backend: latency (EWMA), recent error rate, which backend answered.
+- Hedging: if the primary has not answered after SEARCH_HEDGE_AFTER_MS, the secondary is asked too; first success wins.
+- Circuit breaker: a backend that keeps failing is skipped for SEARCH_BREAKER_COOLDOWN_S, then probed once.
+Cache hits never touch the breaker: it only wraps the upstream call (the guard passed to fetch_topic_async).
+Every upstream result is also added to the local full-text index (app/index.py) used by local_first.
+Rate limits (app/ratelimit.py): a backend over its budget is skipped like a failure but does not count
+against its breaker; if every backend is over budget the local index answers, else RateLimited is raised.
+Everything is async: cache hits, coalescing of identical misses and rate-limit waits all happen on the event
+loop; only the upstream call itself takes a thread from the backend's pool. The jobs thread (app/jobs.py)
+submits its searches to the app's loop.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import AsyncIterator, Callable, List, Optional
+
+from app import search as duckduckgo
+from app.bookshelf import aiter_bookshelf, detach, gather_bookshelf, get_executor, tag_items
+from app.cache import record_uncached
+from app.index import get_resource_index
+from app.metrics import collector, stat_lines
+from app.ratelimit import RateLimited, get_rate_limit_stats
+
+HEDGE_AFTER = float(os.environ.get("SEARCH_HEDGE_AFTER_MS", "1200")) / 1000
+BREAKER_FAILURES = int(os.environ.get("SEARCH_BREAKER_FAILURES", "5"))  # consecutive failures to open
+BREAKER_ERROR_RATE = float(os.environ.get("SEARCH_BREAKER_ERROR_RATE", "0.5"))  # ... or this rate over the window
+BREAKER_WINDOW = int(os.environ.get("SEARCH_BREAKER_WINDOW", "20"))
+BREAKER_COOLDOWN = float(os.environ.get("SEARCH_BREAKER_COOLDOWN_S", "30"))
+
+
+class CircuitOpen(Exception):
+    """Backend skipped because its circuit breaker is open."""
+
+
+class BackendHealth:
+    """Latency/error tracking and circuit breaker (closed -> open -> half_open -> closed) for one backend."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.consecutive_failures = 0
+        self.recent = deque(maxlen=BREAKER_WINDOW)  # True = success
+        self.ewma_latency_ms: Optional[float] = None
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.answered = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def check(self) -> None:
+        """Fail fast while the breaker is open (before an async caller spends a rate-limit token). No side effects
+        beyond counting the rejection: the half-open probe is still claimed by call()."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at < BREAKER_COOLDOWN:
+                self.rejected += 1
+                raise CircuitOpen(f"{self.name} circuit open")
+
+    def note_rate_limited(self) -> None:
+        with self._lock:
+            self.rate_limited += 1
+
+    def call(self, fn: Callable):
+        """Run one upstream call through the breaker, recording latency and outcome."""
+        if not self.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpen(f"{self.name} circuit open")
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except RateLimited:
+            with self._lock:
+                self.probe_in_flight = False
+            self.note_rate_limited()
+            raise
+        except Exception as e:
+            self._record(False, time.perf_counter() - start, e)
+            raise
+        self._record(True, time.perf_counter() - start)
+        return result
+
+    def _record(self, ok: bool, seconds: float, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.calls += 1
+            ms = seconds * 1000
+            self.ewma_latency_ms = ms if self.ewma_latency_ms is None else 0.8 * self.ewma_latency_ms + 0.2 * ms
+            self.recent.append(ok)
+            self.probe_in_flight = False
+            if ok:
+                self.consecutive_failures = 0
+                self.state = "closed"
+                return
+            self.errors += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+            error_rate = self.recent.count(False) / len(self.recent)
+            if (
+                self.state == "half_open"
+                or self.consecutive_failures >= BREAKER_FAILURES
+                or (len(self.recent) >= BREAKER_WINDOW // 2 and error_rate >= BREAKER_ERROR_RATE)
+            ):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "ewma_latency_ms": round(self.ewma_latency_ms, 1) if self.ewma_latency_ms is not None else None,
+                "error_rate": round(self.recent.count(False) / len(self.recent), 3) if self.recent else 0.0,
+                "calls": self.calls,
+                "errors": self.errors,
+                "rejected_by_breaker": self.rejected,
+                "rate_limited": self.rate_limited,
+                "answered": self.answered,
+                "last_error": self.last_error,
+            }
+
+
+def _load_backends() -> dict:
+    backends = {}
+    if os.environ.get("EXA_API_KEY"):
+        try:
+            from app import search_exa
+            backends["exa"] = search_exa
+        except ImportError:
+            pass
+    backends["duckduckgo"] = duckduckgo
+    return backends
+
+
+BACKENDS = _load_backends()
+ORDER = list(BACKENDS)  # primary first
+PRIMARY = ORDER[0]
+health = {name: BackendHealth(name) for name in ORDER}
+_last_answered = {"backend": None, "at": None}
+
+
+def _guard(name: str, topic: str) -> Callable:
+    """Wraps only the upstream call: circuit breaker and health for this backend, then the local index."""
+
+    def guard(upstream: Callable):
+        items = health[name].call(upstream)
+        index = get_resource_index()
+        if index is not None:
+            index.add(items, topic.strip(), backend=name)
+        return items
+
+    return guard
+
+
+async def _fetch_async(kind: str, name: str, topic: str, max_results: int, skip_cache: bool) -> List[dict]:
+    fetch = getattr(BACKENDS[name], "fetch_youtube_async" if kind == "video" else "fetch_topic_async")
+    try:
+        return await fetch(topic, max_results=max_results, skip_cache=skip_cache, guard=_guard(name, topic),
+                           admit=health[name].check)
+    except RateLimited:
+        health[name].note_rate_limited()
+        raise
+
+
+def _answered(name: str, items: List[dict]) -> List[dict]:
+    with health[name]._lock:
+        health[name].answered += 1
+    _last_answered.update(backend=name, at=time.time())
+    return tag_items(items, backend=name)
+
+
+async def _routed(kind: str, topic: str, max_results: int, skip_cache: bool) -> List[dict]:
+    """Primary first; hedge to the secondary after HEDGE_AFTER or on failure. Raises if every backend fails."""
+    start = lambda name: asyncio.ensure_future(_fetch_async(kind, name, topic, max_results, skip_cache))
+    pending = {start(ORDER[0]): ORDER[0]}
+    waiting = list(ORDER[1:])
+    last_error: Optional[Exception] = None
+    try:
+        while pending:
+            timeout = HEDGE_AFTER if waiting else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:  # primary is slow: hedge
+                name = waiting.pop(0)
+                pending[start(name)] = name
+                continue
+            for fut in done:
+                name = pending.pop(fut)
+                try:
+                    items = fut.result()
+                except Exception as e:
+                    last_error = e
+                    if waiting:  # failed (or circuit open): go to the next backend now
+                        nxt = waiting.pop(0)
+                        pending[start(nxt)] = nxt
+                    continue
+                return _answered(name, items)
+        raise last_error or RuntimeError("no search backend available")
+    finally:
+        for fut in pending:  # losing hedge: let it finish and fill its cache
+            detach(fut)
+
+
+async def _in_local_pool(fn: Callable, *args):
+    """Run a local (SQLite) call off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(get_executor("local"), fn, *args)
+
+
+async def search_topic_async(topic: str, max_results: int = 5, skip_cache: bool = False, local_first: bool = False) -> List[dict]:
+    """Search web for a topic via the healthiest backend. Returns list of {title, url, snippet, score, type, backend}.
+    local_first: answer from the local index when it has max_results matches; go upstream only otherwise.
+    Raises RateLimited when every backend is over budget and the local index has nothing."""
+    if not skip_cache:
+        cached = peek_topic(topic, max_results=max_results, record=True)
+        if cached is not None:
+            return cached
+    index = get_resource_index()
+    if local_first and not skip_cache and index is not None:
+        hits = await _in_local_pool(index.lookup, topic, max_results)
+        if hits is not None:
+            record_uncached()  # past results of any age: not for shared caches
+            return hits
+    try:
+        return await _routed("text", topic, max_results, skip_cache)
+    except RateLimited:
+        hits = await _in_local_pool(index.lookup, topic, max_results, 1) if index is not None else None
+        if hits is None:
+            raise
+        record_uncached()  # degraded answer while rate limited
+        return hits
+    except Exception as e:
+        return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "article"}]
+
+
+async def search_youtube_async(topic: str, max_results: int = 5, skip_cache: bool = False) -> List[dict]:
+    """Search YouTube only, routed like search_topic_async. Raises RateLimited when every backend is over budget."""
+    try:
+        return await _routed("video", topic, max_results, skip_cache)
+    except RateLimited:
+        raise
+    except Exception as e:
+        return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "video"}]
+
+
+async def get_bookshelf_async(
+    topics: List[str], per_topic: int = 3, skip_cache: bool = False, deadline: Optional[float] = None, local_first: bool = False
+) -> dict:
+    """Fetch all topics through the router, fanned out as tasks on the event loop. Returns {resources, partial, pending_topics, rate_limited_topics}."""
+    search_fn = partial(search_topic_async, local_first=local_first)
+    return await gather_bookshelf(search_fn, topics, per_topic=per_topic, skip_cache=skip_cache, deadline=deadline)
+
+
+def peek_topic(topic: str, max_results: int = 5, record: bool = False) -> Optional[List[dict]]:
+    """Fresh cached result from any backend (primary first), without going upstream."""
+    for name in ORDER:
+        items = BACKENDS[name].peek_topic(topic, max_results=max_results, record=record)
+        if items is not None:
+            return tag_items(items, backend=name)
+    return None
+
+
+def stream_bookshelf_async(
+    topics: List[str], per_topic: int = 3, skip_cache: bool = False, deadline: Optional[float] = None, local_first: bool = False
+) -> AsyncIterator[dict]:
+    """Per-topic events as they resolve, cached topics first, then a "done" record. See app/bookshelf.py."""
+    search_fn = partial(search_topic_async, local_first=local_first)
+    return aiter_bookshelf(search_fn, peek_topic, topics, per_topic=per_topic, skip_cache=skip_cache, deadline=deadline)
+
+
+def warm_backend() -> None:
+    for name, module in BACKENDS.items():
+        try:
+            module.warm_backend()
+        except Exception as e:
+            print(f"Warm-up of {name} failed:", e)
+
+
+def warm_cache() -> int:
+    return sum(module.warm_cache() for module in BACKENDS.values())
+
+
+def get_cache_stats() -> dict:
+    """Cache stats for /vibe: totals across backends plus each backend's own stats."""
+    per_backend = {name: module.get_cache_stats() for name, module in BACKENDS.items()}
+    return {
+        "cached_queries": sum(s["cached_queries"] for s in per_backend.values()),
+        "max": sum(s["max"] for s in per_backend.values()),
+        "coalesced_callers": sum(s["single_flight"]["coalesced_callers"] for s in per_backend.values()),
+        "backends": per_backend,
+    }
+
+
+def get_router_stats() -> dict:
+    """Backend health for /vibe."""
+    index = get_resource_index()
+    return {
+        "primary": PRIMARY,
+        "order": ORDER,
+        "hedge_after_ms": HEDGE_AFTER * 1000,
+        "last_answered_by": _last_answered["backend"],
+        "backends": {name: h.stats() for name, h in health.items()},
+        "local_index": index.stats() if index is not None else None,
+        "rate_limits": get_rate_limit_stats(),
+    }
+
+
+@collector
+def _search_metrics() -> list:
+    caches = {name: c for module in BACKENDS.values() for name, c in module.get_cache_stats()["caches"].items()}
+    lookups = []
+    for name, c in caches.items():
+        lookups += [(f'{{cache="{name}",result="hit"}}', c["hits"]), (f'{{cache="{name}",result="stale"}}', c["stale_hits"]),
+                    (f'{{cache="{name}",result="miss"}}', c["misses"])]
+    health_stats = {name: h.stats() for name, h in health.items()}
+    limits = get_rate_limit_stats()
+    lines = (
+        stat_lines("search_cache_lookups_total", "counter", "Search cache lookups by result", lookups)
+        + stat_lines("search_cache_hit_ratio", "gauge", "Fresh + stale hits over lookups",
+                     [(f'{{cache="{n}"}}', c["hit_ratio"]) for n, c in caches.items()])
+        + stat_lines("search_cache_entries", "gauge", "Entries in memory", [(f'{{cache="{n}"}}', c["entries"]) for n, c in caches.items()])
+        + stat_lines("search_backend_circuit_open", "gauge", "1 if the breaker is open (or half open)",
+                     [(f'{{backend="{n}"}}', int(h["state"] != "closed")) for n, h in health_stats.items()])
+        + stat_lines("search_backend_answered_total", "counter", "Searches answered by each backend",
+                     [(f'{{backend="{n}"}}', h["answered"]) for n, h in health_stats.items()])
+        + stat_lines("rate_limit_calls_total", "counter", "Outbound calls by rate limiter decision",
+                     [(f'{{backend="{n}",decision="{d}"}}', b[k]) for n, b in limits.items()
+                      for d, k in (("granted", "granted"), ("rejected", "rejected"), ("quota", "quota_rejected"))])
+        + stat_lines("rate_limit_queued_total", "counter", "Granted calls that had to wait for a token",
+                     [(f'{{backend="{n}"}}', b["queued"]) for n, b in limits.items()])
+    )
+    index = get_resource_index()
+    if index is not None:
+        idx = index.stats()
+        lines += stat_lines("local_index_lookups_total", "counter", "local_first lookups against the FTS index",
+                            [('{result="hit"}', idx["local_first_hits"]), ('{result="miss"}', idx["local_first_misses"])])
+    return lines
@@ -2,13 +2,22 @@
 FocusFlow 3D - Person 3: Web Scraper Agent (minimal for short time)
 Uses DuckDuckGo - no API key. Replace with Tavily/SerpAPI later if needed.
 """
-from duckduckgo_search import DDGS
-from typing import List
+from functools import partial
+from typing import Callable, List, Optional
 import re
 
-# Simple in-memory cache so demo doesn't hit rate limits
-_cache: dict = {}
-CACHE_MAX = 200
+from app.bookshelf import fetch_bookshelf, get_executor
+from app.cache import SingleFlight, TTLCache, cached_fetch, cached_fetch_async, combined_stats
+from app.metrics import time_upstream
+from app.ratelimit import get_limiter
+
+# LRU + TTL cache so demo doesn't hit rate limits (see app/cache.py for env knobs)
+_cache = TTLCache("duckduckgo_text")
+_video_cache = TTLCache("duckduckgo_videos")
+# Identical concurrent misses share one upstream call
+_flight = SingleFlight()
+# Outbound token bucket (see app/ratelimit.py): waits briefly, then raises RateLimited
+_limiter = get_limiter("duckduckgo")
 
 
 def _safe_str(s: str) -> str:
@@ -18,63 +27,111 @@ def _safe_str(s: str) -> str:
     return re.sub(r"[^\x00-\x7F]+", " ", s).strip()[:500]
 
 
+def _ddgs():
+    # Imported on first use (or by warm_backend at startup) so importing this module stays fast.
+    from duckduckgo_search import DDGS
+    return DDGS()
+
+
+def warm_backend() -> None:
+    """Import the DuckDuckGo client ahead of the first request."""
+    import duckduckgo_search  # noqa: F401
+
+
+def warm_cache() -> int:
+    """Load recent entries from the persistent cache tier (if configured) into memory."""
+    return _cache.warm() + _video_cache.warm()
+
+
 def get_cache_stats() -> dict:
     """Return cache stats for /vibe."""
-    return {"cached_queries": len(_cache), "max": CACHE_MAX}
+    return {**combined_stats(_cache, _video_cache), "single_flight": _flight.stats()}
+
+
+def _fetch_text(topic: str, max_results: int) -> List[dict]:
+    """One upstream DuckDuckGo text search. Raises on failure."""
+    with time_upstream("duckduckgo", "text"), _ddgs() as ddgs:
+        results = list(ddgs.text(topic, max_results=max_results))
+    out = []
+    for i, r in enumerate(results):
+        url = r.get("href", r.get("link", ""))
+        out.append({
+            "title": _safe_str(r.get("title", "")),
+            "url": url,
+            "snippet": _safe_str(r.get("body", "")),
+            "score": 1.0 - (i * 0.1),
+            "type": "video" if "youtube.com" in url or "youtu.be" in url else "article",
+        })
+    return out
+
+
+def _fetch_videos(topic: str, max_results: int) -> List[dict]:
+    """One upstream DuckDuckGo video search. Raises on failure."""
+    with time_upstream("duckduckgo", "videos"), _ddgs() as ddgs:
+        results = list(ddgs.videos(topic, max_results=max_results))
+    return [
+        {
+            "title": _safe_str(r.get("title", "")),
+            "url": r.get("url", r.get("link", "")),
+            "snippet": _safe_str(r.get("description", "")),
+            "score": 1.0 - (i * 0.1),
+            "type": "video",
+        }
+        for i, r in enumerate(results)
+    ]
+
+
+def peek_topic(topic: str, max_results: int = 5, record: bool = False) -> Optional[List[dict]]:
+    """Fresh in-memory result for this topic, or None. Never goes upstream. record=True counts it as a cache hit."""
+    return _cache.peek((topic.strip().lower(), max_results), record=record)
+
+
+def fetch_topic(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None) -> List[dict]:
+    """Cached, coalesced search that raises on upstream failure. guard wraps only the upstream call (app/router.py)."""
+    key = (topic.strip().lower(), max_results)
+    fetch = lambda: _limiter.run(_fetch_text, topic, max_results)
+    return cached_fetch(_cache, _flight, key, (lambda: guard(fetch)) if guard else fetch, skip_cache=skip_cache)
+
+
+def fetch_youtube(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None) -> List[dict]:
+    """Video variant of fetch_topic."""
+    key = (topic.strip().lower(), max_results)
+    fetch = lambda: _limiter.run(_fetch_videos, topic, max_results)
+    return cached_fetch(_video_cache, _flight, key, (lambda: guard(fetch)) if guard else fetch, skip_cache=skip_cache)
+
+
+async def fetch_topic_async(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None,
+                            admit: Optional[Callable] = None) -> List[dict]:
+    """fetch_topic for the event loop: waiters and the rate-limit wait hold no pool thread (app/cache.py)."""
+    key = (topic.strip().lower(), max_results)
+    return await cached_fetch_async(_cache, _flight, key, partial(_fetch_text, topic, max_results), get_executor("duckduckgo"),
+                                    limiter=_limiter, guard=guard, admit=admit, skip_cache=skip_cache)
+
+
+async def fetch_youtube_async(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None,
+                              admit: Optional[Callable] = None) -> List[dict]:
+    """Video variant of fetch_topic_async."""
+    key = (topic.strip().lower(), max_results)
+    return await cached_fetch_async(_video_cache, _flight, key, partial(_fetch_videos, topic, max_results), get_executor("duckduckgo"),
+                                    limiter=_limiter, guard=guard, admit=admit, skip_cache=skip_cache)
 
 
 def search_topic(topic: str, max_results: int = 5, skip_cache: bool = False) -> List[dict]:
     """Search web for a topic. Returns list of {title, url, snippet, score, type}."""
-    key = (topic.strip().lower(), max_results)
-    if not skip_cache and key in _cache:
-        return _cache[key]
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(topic, max_results=max_results))
-        out = []
-        for i, r in enumerate(results):
-            url = r.get("href", r.get("link", ""))
-            out.append({
-                "title": _safe_str(r.get("title", "")),
-                "url": url,
-                "snippet": _safe_str(r.get("body", "")),
-                "score": 1.0 - (i * 0.1),
-                "type": "video" if "youtube.com" in url or "youtu.be" in url else "article",
-            })
-        if not skip_cache and len(_cache) < CACHE_MAX:
-            _cache[key] = out
-        return out
+        return fetch_topic(topic, max_results=max_results, skip_cache=skip_cache)
     except Exception as e:
         return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "article"}]
 
 
-def search_youtube(topic: str, max_results: int = 5) -> List[dict]:
+def search_youtube(topic: str, max_results: int = 5, skip_cache: bool = False) -> List[dict]:
     """Search YouTube only (DuckDuckGo video search)."""
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.videos(topic, max_results=max_results))
-        return [
-            {
-                "title": _safe_str(r.get("title", "")),
-                "url": r.get("url", r.get("link", "")),
-                "snippet": _safe_str(r.get("description", "")),
-                "score": 1.0 - (i * 0.1),
-                "type": "video",
-            }
-            for i, r in enumerate(results)
-        ]
+        return fetch_youtube(topic, max_results=max_results, skip_cache=skip_cache)
     except Exception as e:
         return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "video"}]
 
 
 def get_bookshelf_resources(topics: List[str], per_topic: int = 3, skip_cache: bool = False) -> List[dict]:
     """For each topic, fetch resources and tag with topic. Frontend can show on bookshelf."""
-    resources = []
-    for t in topics:
-        if not t or not t.strip():
-            continue
-        t = t.strip()
-        for item in search_topic(t, max_results=per_topic, skip_cache=skip_cache):
-            item["topic"] = t
-            resources.append(item)
-    return resources
+    return fetch_bookshelf(search_topic, "duckduckgo", topics, per_topic=per_topic, skip_cache=skip_cache)["resources"]
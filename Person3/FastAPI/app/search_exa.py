@@ -3,41 +3,183 @@ FocusFlow 3D - Person 3: Web Scraper Agent (Exa API).
 Uses Exa for web search. Set EXA_API_KEY in env or .env.
 Same interface as search.py: search_topic(), get_bookshelf_resources().
 """
+import json
 import os
 import re
-from typing import List
+import threading
+from functools import partial
+from typing import Callable, List, Optional
 
-# Optional: load .env if present
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+from app.bookshelf import fetch_bookshelf, get_executor
+from app.cache import SingleFlight, TTLCache, cached_fetch, cached_fetch_async, combined_stats
+from app.metrics import time_upstream
+from app.ratelimit import get_limiter
 
-# In-memory cache for demo and rate limits
-_cache: dict = {}
-CACHE_MAX = 200
+# LRU + TTL cache for demo and rate limits (see app/cache.py for env knobs)
+_cache = TTLCache("exa_search")
+_video_cache = TTLCache("exa_youtube")
+# Identical concurrent misses share one upstream call (saves Exa quota)
+_flight = SingleFlight()
+# Outbound token bucket (see app/ratelimit.py): waits briefly, then raises RateLimited
+_limiter = get_limiter("exa")
+
+SNIPPET_CHARS = 500  # what the bookshelf shows; also the text budget we ask Exa for
+# text (default): page text capped at SNIPPET_CHARS | highlights: query-relevant excerpts | summary: Exa summary
+EXA_CONTENT_MODE = os.environ.get("EXA_CONTENT_MODE", "text").strip().lower()
+EXA_TIMEOUT = float(os.environ.get("EXA_TIMEOUT_S", "10"))
+EXA_POOL_SIZE = int(os.environ.get("EXA_POOL_SIZE", "16"))  # keep-alive connections to api.exa.ai
+
+_client = None
+_client_lock = threading.Lock()
 
 
 def _safe_str(s: str) -> str:
     """Strip problematic chars for Windows/JSON (e.g. emoji)."""
     if not s:
         return ""
-    return re.sub(r"[^\x00-\x7F]+", " ", s).strip()[:500]
+    return re.sub(r"[^\x00-\x7F]+", " ", s).strip()[:SNIPPET_CHARS]
 
 
-def _get_exa_client():
-    """Lazy init Exa client (requires exa-py and EXA_API_KEY)."""
+def _pooled_exa_class():
+    """
+    Exa subclass whose plain GET/POST calls go through one shared requests.Session (keep-alive, connection pool,
+    timeout). exa-py itself calls requests.post per call, i.e. a new TCP + TLS handshake every search.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
     from exa_py import Exa
-    api_key = os.environ.get("EXA_API_KEY")
-    if not api_key:
-        raise ValueError("EXA_API_KEY is not set. Add it to .env or environment.")
-    return Exa(api_key=api_key)
+
+    try:
+        from exa_py.websets.core.base import ExaJSONEncoder
+    except ImportError:
+        ExaJSONEncoder = None
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EXA_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    class PooledExa(Exa):
+        def request(self, endpoint, data=None, method="POST", params=None, headers=None):
+            streaming = (isinstance(data, dict) and data.get("stream")) or (params and params.get("stream") == "true")
+            if streaming or method.upper() not in ("GET", "POST"):
+                return super().request(endpoint, data=data, method=method, params=params, headers=headers)
+            body = data if isinstance(data, str) else (json.dumps(data, cls=ExaJSONEncoder) if data else None)
+            res = session.request(
+                method.upper(), self.base_url + endpoint, data=body, params=params,
+                headers={**self.headers, **(headers or {})}, timeout=EXA_TIMEOUT,
+            )
+            if res.status_code >= 400:
+                raise ValueError(f"Request failed with status code {res.status_code}: {res.text}")
+            return res.json()
+
+    return PooledExa
+
+
+def _get_exa_client():
+    """Process-wide Exa client (requires exa-py and EXA_API_KEY), created on first use and reused."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.environ.get("EXA_API_KEY")
+                if not api_key:
+                    raise ValueError("EXA_API_KEY is not set. Add it to .env or environment.")
+                _client = _pooled_exa_class()(api_key=api_key)
+    return _client
+
+
+def _contents_options() -> dict:
+    """Ask Exa for only as much page content as the snippet uses (it used to be 20000 chars, cut to 500)."""
+    if EXA_CONTENT_MODE == "highlights":
+        return {"highlights": {"max_characters": SNIPPET_CHARS}}
+    if EXA_CONTENT_MODE == "summary":
+        return {"summary": True}
+    return {"text": {"max_characters": SNIPPET_CHARS}}
+
+
+def _snippet(r) -> str:
+    text = getattr(r, "text", None) or getattr(r, "highlights", None) or getattr(r, "summary", None) \
+        or getattr(r, "content", None) or ""
+    if isinstance(text, list):
+        text = " ".join(str(x) for x in text)
+    return _safe_str(str(text)) or _safe_str(getattr(r, "description", "") or "")
+
+
+def warm_backend() -> None:
+    """Import exa_py (about a second) and build the shared client ahead of the first request."""
+    _get_exa_client()
+
+
+def warm_cache() -> int:
+    """Load recent entries from the persistent cache tier (if configured) into memory."""
+    return _cache.warm() + _video_cache.warm()
 
 
 def get_cache_stats() -> dict:
     """Return cache stats for /vibe."""
-    return {"cached_queries": len(_cache), "max": CACHE_MAX}
+    return {**combined_stats(_cache, _video_cache), "single_flight": _flight.stats()}
+
+
+def _fetch_search(topic: str, max_results: int, videos_only: bool = False) -> List[dict]:
+    """One upstream Exa search. Raises on failure."""
+    exa = _get_exa_client()
+    kwargs = {"include_domains": ["youtube.com", "www.youtube.com"]} if videos_only else {}
+    with time_upstream("exa", "videos" if videos_only else "search"):
+        results = exa.search(
+            query=topic,
+            type="auto",
+            num_results=max_results,
+            contents=_contents_options(),
+            **kwargs,
+        )
+    out = []
+    for i, r in enumerate(results.results):
+        url = getattr(r, "url", "") or ""
+        is_video = videos_only or "youtube.com" in url or "youtu.be" in url
+        out.append({
+            "title": _safe_str(getattr(r, "title", "") or ""),
+            "url": url,
+            "snippet": _snippet(r),
+            "score": 1.0 - (i * 0.1),
+            "type": "video" if is_video else "article",
+        })
+    return out
+
+
+def peek_topic(topic: str, max_results: int = 5, record: bool = False) -> Optional[List[dict]]:
+    """Fresh in-memory result for this topic, or None. Never goes upstream. record=True counts it as a cache hit."""
+    return _cache.peek((topic.strip().lower(), max_results), record=record)
+
+
+def fetch_topic(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None) -> List[dict]:
+    """Cached, coalesced search that raises on upstream failure. guard wraps only the upstream call (app/router.py)."""
+    key = (topic.strip().lower(), max_results)
+    fetch = lambda: _limiter.run(_fetch_search, topic, max_results)
+    return cached_fetch(_cache, _flight, key, (lambda: guard(fetch)) if guard else fetch, skip_cache=skip_cache)
+
+
+def fetch_youtube(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None) -> List[dict]:
+    """Video variant of fetch_topic."""
+    key = (topic.strip().lower(), max_results)
+    fetch = lambda: _limiter.run(_fetch_search, topic, max_results, videos_only=True)
+    return cached_fetch(_video_cache, _flight, key, (lambda: guard(fetch)) if guard else fetch, skip_cache=skip_cache)
+
+
+async def fetch_topic_async(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None,
+                            admit: Optional[Callable] = None) -> List[dict]:
+    """fetch_topic for the event loop: waiters and the rate-limit wait hold no pool thread (app/cache.py)."""
+    key = (topic.strip().lower(), max_results)
+    return await cached_fetch_async(_cache, _flight, key, partial(_fetch_search, topic, max_results), get_executor("exa"),
+                                    limiter=_limiter, guard=guard, admit=admit, skip_cache=skip_cache)
+
+
+async def fetch_youtube_async(topic: str, max_results: int = 5, skip_cache: bool = False, guard: Optional[Callable] = None,
+                              admit: Optional[Callable] = None) -> List[dict]:
+    """Video variant of fetch_topic_async."""
+    key = (topic.strip().lower(), max_results)
+    return await cached_fetch_async(_video_cache, _flight, key, partial(_fetch_search, topic, max_results, videos_only=True), get_executor("exa"),
+                                    limiter=_limiter, guard=guard, admit=admit, skip_cache=skip_cache)
 
 
 def search_topic(topic: str, max_results: int = 5, skip_cache: bool = False) -> List[dict]:
@@ -45,78 +187,20 @@ def search_topic(topic: str, max_results: int = 5, skip_cache: bool = False) ->
     Search web for a topic using Exa.
     Returns list of {title, url, snippet} for bookshelf display.
     """
-    key = (topic.strip().lower(), max_results)
-    if not skip_cache and key in _cache:
-        return _cache[key]
     try:
-        exa = _get_exa_client()
-        results = exa.search(
-            query=topic,
-            type="auto",
-            num_results=max_results,
-            contents={"text": {"max_characters": 20000}},
-        )
-        out = []
-        for i, r in enumerate(results.results):
-            url = getattr(r, "url", "") or ""
-            text = getattr(r, "text", None) or getattr(r, "content", None) or ""
-            if isinstance(text, list):
-                text = " ".join(str(x) for x in text)[:500]
-            else:
-                text = _safe_str(str(text)[:500])
-            out.append({
-                "title": _safe_str(getattr(r, "title", "") or ""),
-                "url": url,
-                "snippet": text or _safe_str(getattr(r, "description", "") or ""),
-                "score": 1.0 - (i * 0.1),
-                "type": "video" if "youtube.com" in url or "youtu.be" in url else "article",
-            })
-        if not skip_cache and len(_cache) < CACHE_MAX:
-            _cache[key] = out
-        return out
+        return fetch_topic(topic, max_results=max_results, skip_cache=skip_cache)
     except Exception as e:
         return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "article"}]
 
 
-def search_youtube(topic: str, max_results: int = 5) -> List[dict]:
+def search_youtube(topic: str, max_results: int = 5, skip_cache: bool = False) -> List[dict]:
     """Search YouTube only (Exa restricted to youtube.com)."""
     try:
-        exa = _get_exa_client()
-        results = exa.search(
-            query=topic,
-            type="auto",
-            num_results=max_results,
-            include_domains=["youtube.com", "www.youtube.com"],
-            contents={"text": {"max_characters": 20000}},
-        )
-        out = []
-        for i, r in enumerate(results.results):
-            url = getattr(r, "url", "") or ""
-            text = getattr(r, "text", None) or getattr(r, "content", None) or ""
-            if isinstance(text, list):
-                text = " ".join(str(x) for x in text)[:500]
-            else:
-                text = _safe_str(str(text)[:500])
-            out.append({
-                "title": _safe_str(getattr(r, "title", "") or ""),
-                "url": url,
-                "snippet": text or _safe_str(getattr(r, "description", "") or ""),
-                "score": 1.0 - (i * 0.1),
-                "type": "video",
-            })
-        return out
+        return fetch_youtube(topic, max_results=max_results, skip_cache=skip_cache)
     except Exception as e:
         return [{"title": "Error", "url": "", "snippet": str(e), "score": 0, "type": "video"}]
 
 
 def get_bookshelf_resources(topics: List[str], per_topic: int = 3, skip_cache: bool = False) -> List[dict]:
     """For each topic, fetch resources and tag with topic. Frontend can show on bookshelf."""
-    resources = []
-    for t in topics:
-        if not t or not t.strip():
-            continue
-        t = t.strip()
-        for item in search_topic(t, max_results=per_topic, skip_cache=skip_cache):
-            item["topic"] = t
-            resources.append(item)
-    return resources
+    return fetch_bookshelf(search_topic, "exa", topics, per_topic=per_topic, skip_cache=skip_cache)["resources"]
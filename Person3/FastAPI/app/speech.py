@@ -0,0 +1,257 @@
+"""
+FocusFlow 3D - Person 3: NPC speech (gTTS) with a content-addressed MP3 cache on disk.
+NPC dialogue repeats across sessions, so each (normalized text, lang) is synthesized once.
+gTTS is sync-only: the *_async functions run it on bounded pools and await the result on the event loop;
+identical renders in flight are coalesced on the loop, so waiters do not hold a pool thread.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+from app.cache import SingleFlight
+from app.metrics import ContextThreadPoolExecutor, collector, stat_lines, time_upstream
+
+SPEECH_CACHE_DIR = Path(os.environ.get("SPEECH_CACHE_DIR", "speech_cache"))
+SPEECH_CACHE_MAX_BYTES = int(os.environ.get("SPEECH_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+SPEECH_PRERENDER_CONCURRENCY = int(os.environ.get("SPEECH_PRERENDER_CONCURRENCY", "4"))
+SPEECH_STREAM_CONCURRENCY = int(os.environ.get("SPEECH_STREAM_CONCURRENCY", "8"))
+SPEECH_RENDER_CONCURRENCY = int(os.environ.get("SPEECH_RENDER_CONCURRENCY", "16"))  # /speech renders in flight
+SPEECH_CHUNK_CHARS = int(os.environ.get("SPEECH_CHUNK_CHARS", "200"))
+SPEECH_CACHE_GRACE_S = 60  # files used (hit or written) this recently are never evicted: a response may be sending them
+MAX_TEXT_CHARS = 2000
+
+
+class SpeechUnavailable(Exception):
+    """gTTS is not installed."""
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and cap length so equivalent lines share one cache entry."""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    if len(text) > MAX_TEXT_CHARS:
+        text = text[:MAX_TEXT_CHARS] + "."
+    return text
+
+
+def audio_key(text: str, lang: str) -> str:
+    """Content address for (normalized text, lang). Also used as the ETag."""
+    return hashlib.sha256(f"{lang.strip().lower()}\n{text}".encode("utf-8")).hexdigest()
+
+
+def synthesize(text: str, lang: str) -> bytes:
+    """One gTTS round trip. Raises SpeechUnavailable if gTTS is missing."""
+    try:
+        from gtts import gTTS
+    except ImportError:
+        raise SpeechUnavailable("gTTS not installed. pip install gtts")
+    buf = io.BytesIO()
+    with time_upstream("gtts", "synthesize"):
+        gTTS(text=text, lang=lang, slow=False).write_to_fp(buf)
+    return buf.getvalue()
+
+
+class AudioCache:
+    """
+    MP3 files named by content hash. LRU by mtime (touched on every hit), evicted past max_bytes.
+    The key just written and anything used in the last SPEECH_CACHE_GRACE_S are kept, so the cap is soft.
+    """
+
+    def __init__(self, directory: Path = SPEECH_CACHE_DIR, max_bytes: int = SPEECH_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # lazily computed from disk
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{key}.mp3"
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, data: bytes) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)  # atomic: readers never see a half-written file
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: Path) -> None:
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(p.stat().st_size for p in self.directory.glob("*.mp3"))
+            if self._bytes <= self.max_bytes:
+                return
+            cutoff = time.time() - SPEECH_CACHE_GRACE_S
+            files = []
+            for p in self.directory.glob("*.mp3"):
+                try:
+                    files.append((p.stat().st_mtime, p))
+                except FileNotFoundError:
+                    continue
+            for mtime, p in sorted(files):
+                if self._bytes <= self.max_bytes or mtime >= cutoff:
+                    break  # the rest are newer still
+                if p == keep:
+                    continue
+                try:
+                    size = p.stat().st_size
+                    p.unlink()
+                except OSError:
+                    continue  # already gone, or (Windows) still open for a response
+                self._bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dir": str(self.directory),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+audio_cache = AudioCache()
+_flight = SingleFlight()
+_prerender_pool = ContextThreadPoolExecutor(max_workers=SPEECH_PRERENDER_CONCURRENCY, thread_name_prefix="speech-prerender")
+_stream_pool = ContextThreadPoolExecutor(max_workers=SPEECH_STREAM_CONCURRENCY, thread_name_prefix="speech-stream")
+_render_pool = ContextThreadPoolExecutor(max_workers=SPEECH_RENDER_CONCURRENCY, thread_name_prefix="speech-render")
+
+
+async def _render_async(text: str, lang: str, pool: ContextThreadPoolExecutor) -> Tuple[Path, str, bool]:
+    """(mp3 path, key, was_cached) for already-normalized text. A hit is answered on the loop; identical misses
+    share one task (coalesced on the event loop), so only that one takes a thread from pool for gTTS."""
+    key = audio_key(text, lang)
+    path = audio_cache.get(key)
+    if path is not None:
+        return path, key, True
+    loop = asyncio.get_running_loop()
+    render = lambda: loop.run_in_executor(pool, lambda: audio_cache.put(key, synthesize(text, lang)))
+    return await _flight.do_async(key, render), key, False
+
+
+async def get_or_render_async(text: str, lang: str = "en") -> Tuple[Path, str, bool]:
+    """Return (mp3 path, key, was_cached); a render runs on the bounded render pool."""
+    return await _render_async(text, lang, _render_pool)
+
+
+async def synthesize_async(text: str, lang: str = "en") -> bytes:
+    """Uncached render on the render pool (fallback when a cached file vanished before it was sent)."""
+    return await asyncio.wrap_future(_render_pool.submit(synthesize, text, lang))
+
+
+async def _prerender_one(line: str, lang: str) -> dict:
+    text = normalize_text(line)
+    if not text:
+        return {"text": line, "error": "empty text"}
+    try:
+        _, key, cached = await _render_async(text, lang, _prerender_pool)
+        return {"text": text, "key": key, "url": f"/speech/audio/{key}", "cached": cached}
+    except Exception as e:
+        return {"text": text, "error": str(e)}
+
+
+async def prerender_async(lines: List[str], lang: str = "en") -> List[dict]:
+    """Synthesize a batch of lines ahead of time, SPEECH_PRERENDER_CONCURRENCY at a time. One result per line,
+    errors reported per line."""
+    return list(await asyncio.gather(*(_prerender_one(line, lang) for line in lines)))
+
+
+def split_sentences(text: str, max_chars: int = SPEECH_CHUNK_CHARS) -> List[str]:
+    """
+    Split at sentence boundaries. The first sentence is its own chunk (time-to-first-audio);
+    later sentences are packed into chunks of up to max_chars to keep the number of gTTS calls down.
+    """
+    sentences = [p for p in re.split(r"(?<=[.!?;:])\s+", text) if p]
+    if not sentences:
+        return []
+    chunks = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _read_or_render(path: Path, chunk: str, lang: str) -> bytes:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:  # evicted meanwhile (e.g. by another worker sharing the directory)
+        return synthesize(chunk, lang)
+
+
+async def _render_bytes(chunk: str, lang: str) -> bytes:
+    path, _, _ = await _render_async(chunk, lang, _stream_pool)
+    return await asyncio.wrap_future(_stream_pool.submit(_read_or_render, path, chunk, lang))
+
+
+async def stream_speech_async(text: str, lang: str = "en") -> AsyncIterator[bytes]:
+    """
+    Synthesize normalized text chunk by chunk, in parallel on the stream pool, and return an async iterator of
+    MP3 bytes in order. Chunks go through the audio cache, so repeated sentences are free. The first chunk is
+    awaited before returning, so gTTS errors still surface as an exception instead of a truncated stream.
+    """
+    futures = [asyncio.ensure_future(_render_bytes(chunk, lang)) for chunk in split_sentences(text)]
+    try:
+        first = await futures[0] if futures else b""
+    except BaseException:
+        for fut in futures[1:]:
+            fut.cancel()
+        raise
+
+    async def frames() -> AsyncIterator[bytes]:
+        yield first
+        for fut in futures[1:]:
+            try:
+                yield await fut
+            except Exception:
+                # Headers are already sent; end the audio early rather than emit garbage.
+                for pending in futures:
+                    pending.cancel()
+                return
+
+    return frames()
+
+
+def get_speech_stats() -> dict:
+    return {**audio_cache.stats(), "single_flight": _flight.stats()}
+
+
+@collector
+def _speech_metrics() -> list:
+    s = audio_cache.stats()
+    return (
+        stat_lines("speech_cache_lookups_total", "counter", "Audio cache lookups by result",
+                   [('{result="hit"}', s["hits"]), ('{result="miss"}', s["misses"])])
+        + stat_lines("speech_cache_bytes", "gauge", "Audio cache size on disk", [("", s["bytes"])])
+    )
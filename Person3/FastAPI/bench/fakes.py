@@ -0,0 +1,106 @@
+"""
+Stand-ins for DDGS, Exa and gTTS so the benchmark runs offline and repeatably.
+Each fake sleeps latency_ms (+/- jitter), fails with probability error_rate, and returns
+`results` items with `snippet_chars` of text (or `audio_bytes` of MP3 for gTTS).
+install() patches them in at the library boundary, so the app's own caching, rate limiting,
+routing and metrics code still runs.
+"""
+import random
+import sys
+import time
+import types
+from dataclasses import dataclass
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 150.0
+    jitter_ms: float = 50.0
+    error_rate: float = 0.0
+    results: int = 5
+    snippet_chars: int = 300
+    audio_bytes: int = 16 * 1024
+
+    def sleep(self) -> None:
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay / 1000)
+
+    def maybe_fail(self, service: str) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError(f"fake {service} error")
+
+
+def _text(topic: str, i: int, chars: int) -> str:
+    base = f"{topic} explained, part {i}. "
+    return (base * (chars // len(base) + 1))[:chars]
+
+
+class FakeDDGS:
+    """duckduckgo_search.DDGS: context manager with text() and videos()."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query: str, max_results: int = 5):
+        self.config.sleep()
+        self.config.maybe_fail("ddgs")
+        n = min(max_results, self.config.results)
+        return [{"title": f"{query} #{i}", "href": f"https://example.com/{query.replace(' ', '-')}/{i}",
+                 "body": _text(query, i, self.config.snippet_chars)} for i in range(n)]
+
+    def videos(self, query: str, max_results: int = 5):
+        self.config.sleep()
+        self.config.maybe_fail("ddgs")
+        n = min(max_results, self.config.results)
+        return [{"title": f"{query} video #{i}", "content": f"https://www.youtube.com/watch?v={abs(hash((query, i)))}",
+                 "url": f"https://www.youtube.com/watch?v={abs(hash((query, i)))}",
+                 "description": _text(query, i, self.config.snippet_chars)} for i in range(n)]
+
+
+class FakeExa:
+    """exa_py.Exa: search() returning an object with .results (url, title, text)."""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+
+    def search(self, query: str, num_results: int = 5, include_domains=None, **kwargs):
+        self.config.sleep()
+        self.config.maybe_fail("exa")
+        n = min(num_results, self.config.results)
+        host = "www.youtube.com/watch?v=" if include_domains else "example.org/"
+        results = [types.SimpleNamespace(url=f"https://{host}{query.replace(' ', '-')}-{i}", title=f"{query} #{i}",
+                                         text=_text(query, i, self.config.snippet_chars)) for i in range(n)]
+        return types.SimpleNamespace(results=results)
+
+
+def fake_gtts_class(config: FakeConfig):
+    class FakeGTTS:
+        def __init__(self, text: str, lang: str = "en", slow: bool = False):
+            self.text = text
+
+        def write_to_fp(self, fp):
+            config.sleep()
+            config.maybe_fail("gtts")
+            fp.write(b"ID3" + b"\0" * max(0, config.audio_bytes - 3))
+
+    return FakeGTTS
+
+
+def install(config: FakeConfig) -> None:
+    """Patch the fakes in. Call after setting env vars and before the first request."""
+    gtts_module = sys.modules.get("gtts") or types.ModuleType("gtts")
+    gtts_module.gTTS = fake_gtts_class(config)
+    sys.modules["gtts"] = gtts_module
+
+    from app import search, search_exa
+    search._ddgs = lambda: FakeDDGS(config)
+    search.warm_backend = lambda: None
+    fake_exa = FakeExa(config)
+    search_exa._get_exa_client = lambda: fake_exa
+    search_exa.warm_backend = lambda: None
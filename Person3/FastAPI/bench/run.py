@@ -0,0 +1,248 @@
+"""
+Offline benchmark / load test: runs the app in-process (Starlette TestClient, lifespan included) against
+the fake DDGS, Exa and gTTS in bench/fakes.py and reports throughput and p50/p95/p99 per scenario.
+
+    cd Person3/FastAPI
+    python -m bench.run                                   # all scenarios, results in bench/results/
+    python -m bench.run --latency-ms 300 --error-rate 0.05 --concurrency 32
+    python -m bench.run --only search_cold,speech_warm --compare bench/results/baseline.json
+
+Scenarios: search_cold/search_warm, bookshelf_cold/bookshelf_warm, speech_cold/speech_warm and
+posts_create/posts_list/posts_update/posts_delete. The /posts scenarios are skipped when Postgres
+(DB_* env vars) is not reachable. Outbound and speech rate limits are turned off unless --keep-limits,
+and caches/indexes go to a temporary directory. Needs httpx (for TestClient).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCENARIOS = [
+    "search_cold", "search_warm", "bookshelf_cold", "bookshelf_warm", "speech_cold", "speech_warm",
+    "posts_create", "posts_list", "posts_update", "posts_delete",
+]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_load(call: Callable[[int], int], requests: int, concurrency: int, ok_status=(200, 201, 204)) -> dict:
+    """Issue `requests` calls from `concurrency` threads; summarize latency.
+    call(i) returns a status code (or another marker, counted as an error if not in ok_status)."""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        try:
+            code = call(i)
+            key = None if code in ok_status else str(code)
+        except Exception as e:
+            key = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if key:
+                errors[key] = errors.get(key, 0) + 1
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - wall
+    ms = sorted(x * 1000 for x in latencies)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(errors.values()),
+        "error_codes": errors,
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 1) if wall else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(ms[-1], 2) if ms else 0.0,
+    }
+
+
+def _search_status(r):
+    """Status code, or "error_item" for a 200 whose results include an upstream error placeholder."""
+    if r.status_code != 200:
+        return r.status_code
+    data = r.json()
+    items = data.get("results", data.get("resources", []))
+    return "error_item" if any(item.get("title") == "Error" for item in items) else 200
+
+
+def _db_available(timeout: float) -> bool:
+    from app.database import db_status
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if db_status["ready"]:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def run_benchmarks(client, args, run_id: str) -> Dict[str, dict]:
+    n, c = args.requests, args.concurrency
+    topics = [f"topic {i}" for i in range(4)]
+    shelf = ",".join(topics)
+    only = set(args.only.split(",")) if args.only else set(SCENARIOS)
+    results: Dict[str, dict] = {}
+
+    def scenario(name: str, call: Callable[[int], int], requests: int = n) -> None:
+        if name not in only:
+            return
+        print(f"  {name:<16}", end="", flush=True)
+        results[name] = run_load(call, requests, c)
+        r = results[name]
+        print(f"{r['throughput_rps']:>8} req/s  p50 {r['p50_ms']:>8}ms  p95 {r['p95_ms']:>8}ms  p99 {r['p99_ms']:>8}ms  errors {r['errors']}")
+
+    # cold: every request is a new topic (cache miss, upstream call); warm: a small set that is already cached
+    scenario("search_cold", lambda i: _search_status(client.get("/search", params={"topic": f"{run_id} cold {i}"})))
+    for t in topics:
+        client.get("/search", params={"topic": t})
+    scenario("search_warm", lambda i: _search_status(client.get("/search", params={"topic": topics[i % len(topics)]})))
+    scenario("bookshelf_cold", lambda i: _search_status(client.get(
+        "/bookshelf", params={"topics": ",".join(f"{run_id} shelf {i} {j}" for j in range(4)), "deadline": 0})))
+    client.get("/bookshelf", params={"topics": shelf, "deadline": 0})
+    scenario("bookshelf_warm", lambda i: _search_status(client.get("/bookshelf", params={"topics": shelf})))
+    scenario("speech_cold", lambda i: client.post("/speech", json={"text": f"Line {i} of run {run_id}."}).status_code)
+    scenario("speech_warm", lambda i: client.post("/speech", json={"text": f"Welcome back, line {i % 5}."}).status_code)
+
+    posts = only & {"posts_create", "posts_list", "posts_update", "posts_delete"}
+    if not posts:
+        return results
+    if not _db_available(args.db_wait):
+        print("  posts_*          skipped (database not reachable; set DB_HOST/DB_PASSWORD etc.)")
+        return results
+    ids: List[int] = []
+    ids_lock = threading.Lock()
+
+    def create(i: int) -> int:
+        r = client.post("/posts", json={"title": f"bench {run_id} {i}", "content": "x" * 200})
+        if r.status_code == 201:
+            with ids_lock:
+                ids.append(r.json()["data"]["id"])
+        return r.status_code
+
+    if "posts_create" in posts:
+        scenario("posts_create", create)
+    else:  # rows for the other scenarios
+        for i in range(n):
+            create(i)
+    ids.sort()
+    if ids:
+        scenario("posts_list", lambda i: client.get("/posts", params={"after_id": ids[i % len(ids)] - 1, "limit": 20}).status_code)
+        scenario("posts_update", lambda i: client.put(f"/posts/{ids[i % len(ids)]}", json={"title": f"bench {i}", "content": "y"}).status_code)
+        scenario("posts_delete", lambda i: client.delete(f"/posts/{ids[i]}").status_code, requests=len(ids))
+    if "posts_delete" not in posts:  # leave the table as we found it
+        for post_id in ids:
+            client.delete(f"/posts/{post_id}")
+    return results
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> bool:
+    """Print per-scenario deltas against a saved run. Returns False if any p95/throughput regressed past threshold."""
+    baseline = json.loads(Path(baseline_path).read_text())["scenarios"]
+    ok = True
+    print(f"\nvs {baseline_path}:")
+    for name, r in current.items():
+        b = baseline.get(name)
+        if not b:
+            continue
+        d_p95 = (r["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0.0
+        d_rps = (r["throughput_rps"] - b["throughput_rps"]) / b["throughput_rps"] if b["throughput_rps"] else 0.0
+        regressed = d_p95 > threshold or d_rps < -threshold
+        ok = ok and not regressed
+        print(f"  {name:<16} p95 {b['p95_ms']:>8} -> {r['p95_ms']:>8}ms ({d_p95:+.0%})  "
+              f"rps {b['throughput_rps']:>8} -> {r['throughput_rps']:>8} ({d_rps:+.0%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=150, help="fake upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake upstream failure probability")
+    parser.add_argument("--results", type=int, default=5, help="items per fake search response")
+    parser.add_argument("--snippet-chars", type=int, default=300)
+    parser.add_argument("--audio-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--exa", action="store_true", help="route through the fake Exa as primary backend")
+    parser.add_argument("--only", help="comma-separated scenarios: " + ",".join(SCENARIOS))
+    parser.add_argument("--keep-limits", action="store_true", help="leave rate limits on (default: off)")
+    parser.add_argument("--db-wait", type=float, default=5, help="seconds to wait for Postgres before skipping /posts")
+    parser.add_argument("--out", help="results file (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression threshold for --compare (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="focusflow-bench-")
+    os.environ["SPEECH_CACHE_DIR"] = os.path.join(scratch, "speech")
+    os.environ["RESOURCE_INDEX_PATH"] = os.path.join(scratch, "index.sqlite3")
+    os.environ["SEARCH_CACHE_PERSIST"] = ""
+    if args.exa:
+        os.environ["EXA_API_KEY"] = "bench"
+    if not args.keep_limits:
+        for backend in ("DUCKDUCKGO", "EXA"):
+            os.environ[f"RATE_LIMIT_{backend}_PER_MIN"] = "0"
+        os.environ["SPEECH_RATE_LIMIT_PER_MIN"] = "0"
+    sys.path.insert(0, str(BENCH_DIR.parent))
+
+    from bench.fakes import FakeConfig, install
+    config = FakeConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        results=args.results, snippet_chars=args.snippet_chars, audio_bytes=args.audio_bytes)
+    install(config)
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    print(f"bench {run_id}: {args.requests} requests x {args.concurrency} concurrent, "
+          f"fake latency {args.latency_ms}ms, error rate {args.error_rate}")
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.1)  # startup warm-up runs in the background
+        scenarios = run_benchmarks(client, args, run_id)
+
+    out = Path(args.out) if args.out else BENCH_DIR / "results" / f"{run_id}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    meta = {"run_id": run_id, "commit": _git_commit(), "python": sys.version.split()[0],
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")}}
+    out.write_text(json.dumps({"meta": meta, "scenarios": scenarios}, indent=2))
+    print(f"saved {out}")
+    if args.compare:
+        return 0 if compare(scenarios, args.compare, args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Settings from .env reach the module-level constants in app/* (they are read at import time).
+Run with: python test_env_loading.py  (or pytest; no server or database needed)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Settings the tests write to .env; values already in the environment would win over the file.
+SETTING_PREFIXES = ("DB_", "SEARCH_", "SPEECH_", "SLOW_REQUEST_MS", "RATE_LIMIT_")
+
+
+def _settings_after_import(env_lines, expressions):
+    """Import app.main in a fresh interpreter whose working directory holds a .env; return the evaluated expressions."""
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, ".env"), "w") as f:
+            f.write("\n".join(env_lines) + "\n")
+        code = "import app.main, sys\n" + "".join(f"print(repr({e}))\n" for e in expressions)
+        env = {k: v for k, v in os.environ.items() if not k.startswith(SETTING_PREFIXES)}
+        env["PYTHONPATH"] = HERE
+        out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=env, capture_output=True, text=True, timeout=60)
+        assert out.returncode == 0, out.stderr
+        return out.stdout.splitlines()[-len(expressions):]
+
+
+def test_db_settings_from_dotenv():
+    values = _settings_after_import(
+        ["DB_HOST=db.internal", "DB_POOL_SIZE=20"],
+        ["sys.modules['app.database'].DB_HOST", "sys.modules['app.database'].DB_POOL_SIZE"],
+    )
+    assert values == ["'db.internal'", "20"], values
+    print("DB settings from .env OK")
+
+
+def test_cache_and_speech_settings_from_dotenv():
+    values = _settings_after_import(
+        ["SEARCH_CACHE_TTL=600", "SEARCH_CACHE_PERSIST=sqlite", "SPEECH_CACHE_MAX_BYTES=1048576"],
+        ["sys.modules['app.cache'].CACHE_TTL", "sys.modules['app.cache_store'].SEARCH_CACHE_PERSIST",
+         "app.main.SEARCH_CACHE_PERSIST", "sys.modules['app.speech'].audio_cache.max_bytes"],
+    )
+    assert values == ["600.0", "'sqlite'", "'sqlite'", "1048576"], values
+    print("cache/speech settings from .env OK")
+
+
+def test_slow_request_ms_from_dotenv():
+    values = _settings_after_import(["SLOW_REQUEST_MS=250"], ["sys.modules['app.metrics'].SLOW_REQUEST_MS"])
+    assert values == ["250.0"], values
+    print("SLOW_REQUEST_MS from .env OK")
+
+
+def test_rate_limit_settings_from_dotenv():
+    values = _settings_after_import(
+        ["RATE_LIMIT_MAX_WAIT_MS=2000", "SPEECH_RATE_LIMIT_PER_MIN=6", "SPEECH_RATE_LIMIT_BURST=3"],
+        ["sys.modules['app.ratelimit'].RATE_LIMIT_MAX_WAIT", "app.main.speech_limiter.rate_per_min",
+         "app.main.speech_limiter.burst"],
+    )
+    assert values == ["2.0", "6.0", "3"], values
+    print("rate limit settings from .env OK")
+
+
+if __name__ == "__main__":
+    for name, fn in [("db settings", test_db_settings_from_dotenv),
+                     ("cache/speech settings", test_cache_and_speech_settings_from_dotenv),
+                     ("slow request log", test_slow_request_ms_from_dotenv),
+                     ("rate limit settings", test_rate_limit_settings_from_dotenv)]:
+        try:
+            fn()
+        except Exception as e:
+            print(f"FAIL {name}:", e)
+            raise